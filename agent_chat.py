@@ -3,17 +3,22 @@ from pydantic import BaseModel, HttpUrl
 from typing import Optional, Dict, Any
 from uuid import uuid4
 from dotenv import load_dotenv
-from mem0_agent_client import process_mem0_message
+from mem0_agent_client import process_mem0_message, stream_mem0_message
 from fastapi.responses import StreamingResponse, JSONResponse
 
+import logging
 import requests
 import os
 
 if os.getenv("ENV") != "production":
     load_dotenv(override=True)
 
+# mem0_agent 로거의 자식이므로 같은 큐 핸들러로 출력됨
+logger = logging.getLogger("mem0_agent.api")
+
 def add_routes_to_app(app):
     app.add_api_route("/multi-agent/chat", chat_message, methods=["POST"])
+    app.add_api_route("/multi-agent/chat/stream", chat_message_stream, methods=["POST"])
     app.add_api_route("/multi-agent/health-check", health_check, methods=["GET"])
     app.add_api_route("/multi-agent/fetch-data", fetch_data, methods=["GET"])
 
@@ -43,9 +48,27 @@ async def chat_message(message: ChatMessage):
         return JSONResponse(content=response)
         
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
+        logger.exception("Error in chat endpoint")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def chat_message_stream(message: ChatMessage):
+    """/multi-agent/chat과 같은 요청을 받아 답변을 SSE로 스트리밍합니다."""
+    agent_id = message.options.get("agent_id") if message.options else None
+    is_learning_mode = message.options.get("is_learning_mode") if message.options else False
+
+    if not agent_id:
+        raise HTTPException(status_code=400, detail="agent_id is required for Mem0 agent")
+
+    return StreamingResponse(
+        stream_mem0_message(
+            text=message.text,
+            agent_id=agent_id,
+            chat_room_id=message.chat_room_id,
+            is_learning_mode=is_learning_mode
+        ),
+        media_type="text/event-stream"
+    )
+
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
@@ -60,6 +83,6 @@ def fetch_data(agent_url: str = Query(..., description="Agent URL to fetch data
         )
         return agent_data.json()
     except Exception as e:
-        print(f"Error in fetch_data endpoint: {str(e)}")
+        logger.exception("Error in fetch_data endpoint")
         raise HTTPException(status_code=500, detail=str(e))
 
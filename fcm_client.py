@@ -4,6 +4,8 @@ FCM Service HTTP Client
 FCM 서비스와 통신하기 위한 클라이언트 함수들
 """
 import os
+import time
+import orjson
 import requests
 from typing import Optional, Dict, Any
 import logging
@@ -13,6 +15,12 @@ logger = logging.getLogger(__name__)
 # FCM 서비스 URL 설정
 FCM_SERVICE_URL = os.getenv("FCM_SERVICE_URL", "http://fcm-service:8666")
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 헬스체크 결과 캐시 (정상 응답만 짧게 재사용)
+HEALTH_CACHE_TTL_SECONDS = 5.0
+_last_healthy_at: Optional[float] = None
+
 def send_fcm_notification(user_id: str, notification_data: dict) -> dict:
     """
     FCM 서비스를 통해 푸시 알림을 전송합니다.
@@ -37,10 +45,10 @@ def send_fcm_notification(user_id: str, notification_data: dict) -> dict:
             "data": notification_data.get('data', {})
         }
         
-        response = requests.post(url, json=payload, timeout=10)
+        response = requests.post(url, data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=10)
         
         if response.status_code == 200:
-            return response.json()
+            return orjson.loads(response.content)
         else:
             logger.error(f"FCM 서비스 오류: {response.status_code} - {response.text}")
             return {"success": False, "message": f"HTTP {response.status_code}: {response.text}"}
@@ -68,7 +76,7 @@ def get_device_token(user_id: str) -> Optional[str]:
         response = requests.get(url, timeout=10)
         
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             return data.get('device_token')
         else:
             logger.error(f"FCM 서비스 오류: {response.status_code} - {response.text}")
@@ -85,21 +93,31 @@ def check_fcm_service_health() -> bool:
     """
     FCM 서비스의 상태를 확인합니다.
     
+    최근 HEALTH_CACHE_TTL_SECONDS 이내에 정상 응답을 받았다면 요청 없이 캐시된 결과를 반환합니다.
+    
     Returns:
         bool: 서비스 정상 여부
     """
+    global _last_healthy_at
+    if _last_healthy_at is not None and time.monotonic() - _last_healthy_at < HEALTH_CACHE_TTL_SECONDS:
+        return True
+
     try:
         url = f"{FCM_SERVICE_URL}/health"
         
         response = requests.get(url, timeout=5)
         
         if response.status_code == 200:
-            data = response.json()
-            return data.get('status') == 'healthy'
+            data = orjson.loads(response.content)
+            healthy = data.get('status') == 'healthy'
+            _last_healthy_at = time.monotonic() if healthy else None
+            return healthy
         else:
+            _last_healthy_at = None
             return False
             
     except Exception as e:
+        _last_healthy_at = None
         logger.error(f"FCM 서비스 헬스체크 오류: {e}")
         return False
 
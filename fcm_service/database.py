@@ -6,39 +6,45 @@ import uuid
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from fastapi import HTTPException
-from datetime import datetime, timedelta
+from datetime import timedelta
 import pytz
 from contextvars import ContextVar
 from dotenv import load_dotenv
 import socket
 from firebase_admin import credentials, messaging
 import firebase_admin
-import logging
 import asyncio
+from queue_logging import setup_queue_logging
 
-supabase_client_var = ContextVar('supabase', default=None)
 subdomain_var = ContextVar('subdomain', default='localhost')
 
 # 전역 변수로 변경
 firebase_app = None
 
+# FCM 서비스에서는 Supabase 클라이언트가 프로세스 전역이므로 ContextVar 대신 모듈 변수로 보관
+_SUPABASE: Optional[Client] = None
+
+# 모든 FCM 메시지에 공통으로 사용하는 플랫폼 설정 (메시지마다 새로 만들지 않도록 재사용)
+_DEFAULT_ANDROID_CONFIG = messaging.AndroidConfig(priority='high')
+_DEFAULT_APNS_CONFIG = messaging.APNSConfig(
+    payload=messaging.APNSPayload(
+        aps=messaging.Aps(badge=1, sound='default')
+    )
+)
+_DEFAULT_NOTIFICATION_TITLE = '알림'
+
 # Realtime 로그 설정
-realtime_logger = logging.getLogger("realtime_subscriber")
-if not realtime_logger.handlers:
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-    realtime_logger.addHandler(handler)
-    realtime_logger.setLevel(logging.INFO)
+realtime_logger = setup_queue_logging("realtime_subscriber")
 
 def setting_database():
+    global _SUPABASE
     try:
         if os.getenv("ENV") != "production":
             load_dotenv()
         
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_KEY")
-        supabase: Client = create_client(supabase_url, supabase_key)
-        supabase_client_var.set(supabase)
+        _SUPABASE = create_client(supabase_url, supabase_key)
         
     except Exception as e:
         print(f"Database configuration error: {e}")
@@ -64,9 +70,9 @@ def fetch_device_token(user_id: str) -> Optional[str]:
         Optional[str]: 디바이스 토큰
     """
     try:
-        supabase = supabase_client_var.get()
+        supabase = _SUPABASE
         if supabase is None:
-            raise Exception("Supabase client is not configured for this request")
+            raise Exception("Supabase client is not configured")
         
         response = supabase.table('user_devices').select('device_token').eq('user_email', user_id).execute()
         
@@ -117,7 +123,7 @@ def send_fcm_message(user_id: str, notification_data: dict) -> dict:
                 
             except Exception as e:
                 import traceback
-                realtime_logger.error(f"Stack trace: {traceback.format_exc()}")
+                realtime_logger.error("Stack trace: %s", traceback.format_exc())
         
         if not firebase_app:
             raise Exception("Firebase app is not initialized")
@@ -125,12 +131,9 @@ def send_fcm_message(user_id: str, notification_data: dict) -> dict:
         success_count = 0
         failed = False
 
-        title = notification_data.get('title', '알림')
-        body = notification_data.get('body', notification_data.get('description', ''))
-        data = notification_data.get('data', {})
-        data['type'] = notification_data.get('type', 'general')
-        data['url'] = notification_data.get('url', '')
-        sender_name = notification_data.get('from_user_id', '')  # 발신자 이름
+        title = notification_data.get('title', _DEFAULT_NOTIFICATION_TITLE)
+        body = notification_data['body'] if 'body' in notification_data else notification_data.get('description', '')
+        sender_name = notification_data.get('from_user_id')  # 발신자 이름
 
         if sender_name:
             noti_title = sender_name
@@ -139,8 +142,14 @@ def send_fcm_message(user_id: str, notification_data: dict) -> dict:
             noti_title = title
             noti_body = body
 
-        data['title'] = noti_title
-        data['body'] = noti_body
+        # 호출자의 data dict를 변경하지 않고 한 번에 구성
+        data = {
+            **notification_data.get('data', {}),
+            'type': notification_data.get('type', 'general'),
+            'url': notification_data.get('url', ''),
+            'title': noti_title,
+            'body': noti_body,
+        }
 
         message = messaging.Message(
             token=device_token,
@@ -149,24 +158,15 @@ def send_fcm_message(user_id: str, notification_data: dict) -> dict:
                 body=noti_body
             ),
             data=data,
-            android=messaging.AndroidConfig(
-                priority='high',
-            ),
-            apns=messaging.APNSConfig(
-                payload=messaging.APNSPayload(
-                    aps=messaging.Aps(
-                        badge=1,
-                        sound='default'
-                    )
-                )
-            )
+            android=_DEFAULT_ANDROID_CONFIG,
+            apns=_DEFAULT_APNS_CONFIG
         )
         
         try:
             response = messaging.send(message)
             success_count = 1
         except Exception as e:
-            print(f"FCM 메시지 전송 오류: {e}")
+            realtime_logger.error("FCM 메시지 전송 오류: %s", e)
             failed = True
         
         return {
@@ -175,7 +175,7 @@ def send_fcm_message(user_id: str, notification_data: dict) -> dict:
         }
     
     except Exception as e:
-        print(f"FCM 메시지 전송 오류: {e}")
+        realtime_logger.error("FCM 메시지 전송 오류: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -200,7 +200,7 @@ def handle_new_notification(notification_record):
         else:
             url = notification_record.get('url', '')
 
-        print(f"url: {url}")
+        realtime_logger.debug("url: %s", url)
         
         notification_data = {
             'title': notification_record.get('title', '새 알림'),
@@ -216,32 +216,65 @@ def handle_new_notification(notification_record):
         
         # FCM 메시지 전송
         result = send_fcm_message(user_id, notification_data)
-        realtime_logger.info(f"FCM 알림 전송 결과: {result}")
+        realtime_logger.info("FCM 알림 전송 결과: %s", result)
         
     except Exception as e:
-        realtime_logger.error(f"알림 처리 중 오류 발생: {e}")
+        realtime_logger.error("알림 처리 중 오류 발생: %s", e)
+
+
+def handle_coalesced_notifications(user_id: str, notification_records: List[dict]):
+    """
+    같은 사용자에게 한 번에 도착한 여러 알림을 하나의 FCM 푸시 알림으로 묶어 전송하는 핸들러
+    """
+    try:
+        # 가장 최근 알림의 url을 대표 url로 사용
+        latest_record = max(notification_records, key=lambda record: record.get('created_at') or '')
+        tenant_id = latest_record.get('tenant_id', '')
+        url = latest_record.get('url', '')
+        if tenant_id and url:
+            url = f"https://{tenant_id}.process-gpt.io{url}"
+
+        notification_data = {
+            'title': '새 알림',
+            'body': f"새로운 알림 {len(notification_records)}건이 도착했습니다.",
+            'type': latest_record.get('type', 'general'),
+            'url': url,
+            'data': {
+                'notification_id': str(latest_record.get('id', '')),
+                'notification_ids': ','.join(str(record.get('id', '')) for record in notification_records),
+                'url': latest_record.get('url', '')
+            }
+        }
+
+        # FCM 메시지 전송
+        result = send_fcm_message(user_id, notification_data)
+        realtime_logger.info("FCM 묶음 알림 전송 결과 (%d건): %s", len(notification_records), result)
+
+    except Exception as e:
+        realtime_logger.error("묶음 알림 처리 중 오류 발생: %s", e)
 
 
 def fetch_unprocessed_notifications() -> Optional[List[dict]]:
     try:
         pod_id = socket.gethostname()
-        supabase = supabase_client_var.get()
+        supabase = _SUPABASE
         if supabase is None:
-            raise Exception("Supabase client is not configured for this request")
+            raise Exception("Supabase client is not configured")
         
         env = os.getenv("ENV")
 
         # 1) ENV 기반 tenant 필터 적용 후 조회
+        # 알림 전체 row는 선점 UPDATE 응답으로 받으므로 여기서는 id만 조회
         if env == 'dev':
             response = supabase.table('notifications') \
-                .select('*') \
+                .select('id') \
                 .is_('consumer', 'null') \
                 .eq('tenant_id', 'uengine') \
                 .limit(10) \
                 .execute()
         else:
             response = supabase.table('notifications') \
-                .select('*') \
+                .select('id') \
                 .is_('consumer', 'null') \
                 .neq('tenant_id', 'uengine') \
                 .limit(10) \
@@ -255,68 +288,72 @@ def fetch_unprocessed_notifications() -> Optional[List[dict]]:
         updated_notifications = []
         
         try:
+            # updated_at은 DB 트리거(now())가 설정
             batch_update_response = supabase.table('notifications').update({
-                'consumer': pod_id,
-                'updated_at': datetime.now().isoformat()
+                'consumer': pod_id
             }).in_('id', notification_ids).is_('consumer', 'null').execute()
             
             if batch_update_response.data:
                 updated_notifications = batch_update_response.data
-                realtime_logger.info(f"Successfully claimed {len(updated_notifications)} notifications for pod {pod_id}")
+                realtime_logger.info("Successfully claimed %d notifications for pod %s", len(updated_notifications), pod_id)
             else:
                 realtime_logger.info("No notifications were claimed in batch update")
                 
         except Exception as batch_error:
-            realtime_logger.warning(f"Batch update failed, falling back to individual updates: {batch_error}")
+            realtime_logger.warning("Batch update failed, falling back to individual updates: %s", batch_error)
             
             # 3) 폴백: 개별 업데이트
             for notification in response.data:
                 try:
                     update_response = supabase.table('notifications').update({
-                        'consumer': pod_id,
-                        'updated_at': datetime.now().isoformat()
+                        'consumer': pod_id
                     }).eq('id', notification['id']).is_('consumer', 'null').execute()
                     
                     if update_response.data:
                         updated_notifications.append(update_response.data[0])
-                        realtime_logger.info(f"Successfully claimed notification {notification['id']} for pod {pod_id}")
+                        realtime_logger.info("Successfully claimed notification %s for pod %s", notification['id'], pod_id)
                     else:
-                        realtime_logger.info(f"Notification {notification['id']} was already claimed by another pod")
+                        realtime_logger.info("Notification %s was already claimed by another pod", notification['id'])
                 except Exception as e:
-                    realtime_logger.warning(f"Failed to update notification {notification['id']}: {e}")
+                    realtime_logger.warning("Failed to update notification %s: %s", notification['id'], e)
                     continue
         
         return updated_notifications if updated_notifications else None
         
     except Exception as e:
-        realtime_logger.error(f"미처리 알림 fetch 실패: {str(e)}")
+        realtime_logger.error("미처리 알림 fetch 실패: %s", e)
         return None
 
 
+def dispatch_notifications(notifications: List[dict]):
+    """
+    선점한 알림들을 사용자별로 묶어 FCM 푸시를 전송합니다.
+    """
+    # 같은 사용자에게 온 알림은 하나의 푸시로 묶어서 전송
+    notifications_by_user: Dict[str, List[dict]] = {}
+    for notification in notifications:
+        user_id = notification.get('user_id')
+        if not user_id:
+            handle_new_notification(notification)
+            continue
+        notifications_by_user.setdefault(user_id, []).append(notification)
+
+    for user_id, user_notifications in notifications_by_user.items():
+        if len(user_notifications) == 1:
+            handle_new_notification(user_notifications[0])
+        else:
+            handle_coalesced_notifications(user_id, user_notifications)
+
+
 async def check_new_notifications():
     """
     미처리 알림을 체크하고 FCM 푸시를 전송합니다.
+    동기 Supabase/FCM 호출은 이벤트 루프(API 서버와 공유)를 막지 않도록 워커 스레드에서 실행합니다.
     """
     try:
-        notifications = fetch_unprocessed_notifications()
+        notifications = await asyncio.to_thread(fetch_unprocessed_notifications)
         if notifications:
-            
-            for notification in notifications:
-                handle_new_notification(notification)
+            await asyncio.to_thread(dispatch_notifications, notifications)
         
     except Exception as e:
-        realtime_logger.error(f"알림 체크 중 오류: {e}")
-
-
-async def notification_polling_task():
-    """
-    15초마다 새로운 알림을 체크하는 폴링 태스크
-    """
-    while True:
-        try:
-            await check_new_notifications()
-            await asyncio.sleep(15)  # 15초 대기
-            
-        except Exception as e:
-            realtime_logger.error(f"폴링 태스크 오류: {e}")
-            await asyncio.sleep(15)  # 오류 발생 시에도 15초 후 재시도
\ No newline at end of file
+        realtime_logger.error("알림 체크 중 오류: %s", e)
@@ -2,6 +2,7 @@ import asyncio
 import signal
 from typing import Set
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -14,7 +15,7 @@ from database import (
 running_tasks: Set[asyncio.Task] = set()
 shutdown_event = asyncio.Event()
 
-app = FastAPI(title="FCM Service", version="1.0.0")
+app = FastAPI(title="FCM Service", version="1.0.0", default_response_class=ORJSONResponse)
 
 class NotificationRequest(BaseModel):
     user_id: str
@@ -0,0 +1,19 @@
+-- notifications.updated_at을 애플리케이션(파드 시계) 대신 DB에서 설정
+ALTER TABLE notifications ALTER COLUMN updated_at SET DEFAULT now();
+
+CREATE OR REPLACE FUNCTION set_notifications_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_notifications_updated_at ON notifications;
+
+CREATE TRIGGER trg_notifications_updated_at
+    BEFORE UPDATE ON notifications
+    FOR EACH ROW
+    EXECUTE FUNCTION set_notifications_updated_at();
@@ -0,0 +1,23 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+
+def setup_queue_logging(name: str, level: int = logging.INFO) -> logging.Logger:
+    """
+    로그 출력을 큐를 거쳐 별도 스레드에서 수행하는 로거를 반환합니다.
+    로그가 몰려도 stdout/stderr 쓰기가 이벤트 루프나 폴링 루프를 막지 않습니다.
+    (API 서버의 mem0 에이전트와 FCM 서비스가 함께 사용)
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(level)
+    return logger
@@ -1,38 +1,184 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .clients import ClientFactory
-from .factories import LangchainMessageFactory
-from .clients.base import StreamingResponse
+from .factories import LangchainMessageFactory, messages_digest
+from .clients.base import BaseClient
 from Usage import usage
+from database import subdomain_var
+from llm_cache import is_deterministic
 
-from langchain.schema import Generation
+from langchain.schema import BaseMessage, Generation
 from langchain.globals import get_llm_cache
+from cachetools import LRUCache
+from fastapi.responses import ORJSONResponse
 
-import hashlib, json, asyncio
+import hashlib, asyncio
+import functools
+import logging
 import os
+import re
+import threading
+import unicodedata
+import orjson
+import tiktoken
 
 ENV = os.getenv("ENV")
+# 사용량 기록(usage) 연동이 꺼져 있으면 토큰 계산 경로 전체를 건너뜀
+ACCOUNTING_ENABLED = os.getenv("ACCOUNTING_ENABLED", "0") == "1"
 
-def build_prompt_for_cache(vendor: str, model: str, messages: list, model_config: dict) -> str:
-    return json.dumps({
+logger = logging.getLogger(__name__)
+
+SSE_DATA_PATTERN = re.compile(rb"^\s*data:\s*(.*?)\s*$", re.S)
+
+# 동일 프롬프트 응답 캐시 (메모리 LRU → langchain llm cache 순으로 조회)
+PROMPT_CACHE_MAX_SIZE = 1024
+_prompt_cache: LRUCache = LRUCache(maxsize=PROMPT_CACHE_MAX_SIZE)
+
+def build_prompt_cache_key(vendor: str, model: str, messages: list, model_config: dict) -> str:
+    """정규화된 요청을 SHA-256으로 해시한 캐시 키"""
+    return hashlib.sha256(orjson.dumps({
         "vendor": vendor,
         "model": model,
         "messages": messages,
         "model_config": model_config
-    }, sort_keys=True, ensure_ascii=False)
+    }, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def canonicalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    응답 캐시 키 계산용으로 메시지를 정규화합니다. (끝 공백 제거 + 유니코드 NFC)
+    제공자에게는 원본 메시지를 그대로 보내므로 키에만 사용합니다.
+    """
+    canonical_messages = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            canonical_content = content.rstrip()
+            if not unicodedata.is_normalized("NFC", canonical_content):
+                canonical_content = unicodedata.normalize("NFC", canonical_content)
+            if canonical_content is not content:
+                msg = {**msg, "content": canonical_content}
+        canonical_messages.append(msg)
+    return canonical_messages
+
+def build_llm_string(vendor: str, model: str, model_config: dict) -> str:
+    """실제 모델 설정(temperature 포함)을 담은 llm_string. 결정적 호출 판별과 캐시 키에 함께 사용"""
+    config = orjson.dumps(model_config or {}, option=orjson.OPT_SORT_KEYS).decode()
+    return f"{vendor}:{model}:{config}"
+
+def lookup_cached_response(prompt_key: str, llm_string: str):
+    # 샘플링된 응답(temperature>0 또는 미지정)은 재사용하지 않음
+    if not is_deterministic(llm_string):
+        return None
+    # 메모리 LRU도 SQLite 캐시와 마찬가지로 테넌트별로 분리
+    memory_key = (subdomain_var.get(), prompt_key, llm_string)
+    cached_text = _prompt_cache.get(memory_key)
+    if cached_text is not None:
+        return cached_text
+
+    cache = get_llm_cache()
+    if cache is None:
+        return None
+    cached_generations = cache.lookup(prompt_key, llm_string)
+    if not cached_generations:
+        return None
+    cached_text = cached_generations[0].text
+    _prompt_cache[memory_key] = cached_text
+    return cached_text
+
+def update_cached_response(prompt_key: str, llm_string: str, text: str):
+    if not is_deterministic(llm_string):
+        return
+    _prompt_cache[(subdomain_var.get(), prompt_key, llm_string)] = text
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.update(prompt_key, llm_string, [Generation(text=text)])
+
+@functools.lru_cache(maxsize=32)
+def get_response_encoder(model: str):
+    """응답 토큰 계산용 인코더 (로드 실패 시 None → 글자 수 기반 추정)"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # OpenAI 이외 모델은 근사치로 최신 인코딩 사용
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.error("Failed to load tokenizer for %s: %s", model, e)
+        return None
+
+def count_text_tokens(encoder, text: str) -> int:
+    if encoder is None:
+        return len(text) // 4  # 대략적인 추정 (4글자 ≈ 1토큰)
+    return len(encoder.encode_ordinary(text))
+
+# 토큰 수 캐시 (동일한 시스템 프롬프트/대화 이력을 반복 토큰화하지 않도록)
+TOKEN_COUNT_CACHE_MAX_SIZE = 4096
+_token_count_cache: LRUCache = LRUCache(maxsize=TOKEN_COUNT_CACHE_MAX_SIZE)
+_token_count_cache_lock = threading.Lock()  # 토큰 계산은 워커 스레드에서도 실행됨
 
-def build_llm_string(vendor: str, model: str) -> str:
-    return f"{vendor}:{model}"
+def build_token_count_key(vendor: str, model: str, lc_messages: List[BaseMessage]):
+    # 요청당 한 번 계산된 메시지 해시(blake2b 128bit)를 재사용
+    return (vendor, model, messages_digest(lc_messages))
+
+# 사용량 기록은 스트리밍 응답 경로 밖의 백그라운드 워커에서 처리
+USAGE_QUEUE_MAX_SIZE = 1024
+_usage_queue: Optional[asyncio.Queue] = None
+_usage_worker: Optional[asyncio.Task] = None
+
+async def _consume_usage_queue(queue: asyncio.Queue):
+    while True:
+        raw_data = await queue.get()
+        try:
+            # await asyncio.to_thread(usage, raw_data)
+            if logger.isEnabledFor(logging.DEBUG):
+                token_usage = next(iter(raw_data["usage"].values()))
+                logger.debug("Usage recorded - Request: %s, Response: %s", token_usage["request"], token_usage["response"])
+        except Exception as e:
+            logger.error("Failed to record usage: %s", e)
+        finally:
+            queue.task_done()
+
+def enqueue_usage(raw_data: dict):
+    """사용량 기록을 큐에 넣고 바로 반환합니다. 큐가 가득 차면 기록을 버립니다."""
+    global _usage_queue, _usage_worker
+    if _usage_worker is None or _usage_worker.done():
+        _usage_queue = asyncio.Queue(maxsize=USAGE_QUEUE_MAX_SIZE)
+        _usage_worker = asyncio.get_running_loop().create_task(_consume_usage_queue(_usage_queue))
+    try:
+        _usage_queue.put_nowait(raw_data)
+    except asyncio.QueueFull:
+        logger.warning("Usage queue is full, dropping usage record")
 
 class ChatInterface:
     @staticmethod
     async def messages(vendor: str, model: str, messages: List[Dict[str, Any]], stream: bool, modelConfig: Dict[str, Any]):
+        vendor = ClientFactory.resolve_vendor(vendor)
         client = ClientFactory.get_client(vendor)
+
+        if ENV != "production":
+            prompt_key = build_prompt_cache_key(vendor, model, canonicalize_messages(messages), modelConfig)
+            llm_string = build_llm_string(vendor, model, modelConfig)
+            
+            cached_text = lookup_cached_response(prompt_key, llm_string)
+            
+            if cached_text is not None:
+                frame_prefix = client._format_stream_prefix(client._generate_response_id())
+
+                async def stream_cached_response(text: str):
+                    yield client._format_stream_chunk(text, frame_prefix)
+                    yield client._format_stream_done()
+
+                return client.sse_response(stream_cached_response(cached_text))
+
+        # 캐시 적중 시에는 필요 없으므로 캐시 조회 이후에 메시지 변환 및 토큰 계산
         lc_messages = LangchainMessageFactory.create_messages(messages)
-        # 요청 프롬프트 토큰 계산
-        request_tokens = ChatInterface.count_tokens(vendor, model, messages)
-        print(f"[DEBUG] Request tokens: {request_tokens}")
+        # 요청 프롬프트 토큰 계산은 LLM 호출 시작과 병렬로 워커 스레드에서 수행
+        request_tokens_task = None
+        if ACCOUNTING_ENABLED:
+            request_tokens_task = asyncio.create_task(
+                asyncio.to_thread(ChatInterface.count_tokens_lc, client, lc_messages, model)
+            )
         
-        def record_usage(total_tokens: int, response_text: str = ""):
+        def record_usage(request_tokens: int, total_tokens: int, response_text: str = ""):
             """토큰 사용량을 기록하는 헬퍼 함수"""
             raw_data = {
                 "serviceId":       "chat_llm", 
@@ -47,28 +193,7 @@ class ChatInterface:
                 "process_inst_id": None,
                 "agent_id":        None
             }
-            try:
-                # usage(raw_data)
-                print(f"[DEBUG] Usage recorded - Total tokens: {total_tokens} (Request: {request_tokens}, Response: {total_tokens - request_tokens})")
-            except Exception as e:
-                print(f"[ERROR] Failed to record usage: {e}")
-        
-
-        if ENV != "production":
-            prompt = build_prompt_for_cache(vendor, model, messages, modelConfig)
-            llm_string = build_llm_string(vendor, model)
-            
-            cache = get_llm_cache()
-            cached_generations = cache.lookup(prompt, llm_string)
-            
-            if cached_generations:
-                cached_text = cached_generations[0].text
-
-                async def stream_cached_response(text: str):
-                    yield f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n"
-                    yield "data: [DONE]\n\n"
-
-                return StreamingResponse(stream_cached_response(cached_text), media_type="text/event-stream")
+            enqueue_usage(raw_data)
 
         if stream:
             response = await client.stream_response(
@@ -77,88 +202,131 @@ class ChatInterface:
                 modelConfig=modelConfig
             )
 
-            result_text = ""
+            # 응답 조각은 리스트에 모았다가 스트림 종료 후 한 번만 합침 (+= 반복 시 O(n^2) 복사)
+            result_parts = []
+            response_tokens = 0
+            encoder = get_response_encoder(model) if ACCOUNTING_ENABLED else None
+            # 응답 텍스트는 사용량 계산 또는 응답 캐시에만 필요
+            track_text = ACCOUNTING_ENABLED or ENV != "production"
             
             async def streaming_response():
-                nonlocal result_text
+                nonlocal response_tokens
+                # 델타 병합은 BaseClient.stream_response에서 이미 수행하므로 받은 프레임을 바로 전달
                 async for chunk in response.body_iterator:
-                    parsed = chunk.strip().removeprefix("data: ").removesuffix("\n\n")
-                    try:
-                        obj = json.loads(parsed)
-                        content = obj["choices"][0]["delta"].get("content")
-                        if content:
-                            result_text += content
-                    except:
-                        pass
+                    if track_text:
+                        raw = chunk if isinstance(chunk, bytes) else chunk.encode()
+                        # 우리 클라이언트가 만든 프레임은 형식이 고정이므로 위치 기반으로 자르고, 그 외만 정규식 사용
+                        if raw.startswith(b"data: ") and raw.endswith(b"\n\n"):
+                            payload = raw[6:-2]
+                        else:
+                            match = SSE_DATA_PATTERN.match(raw)
+                            payload = match.group(1) if match else None
+                        if payload is not None and payload != b"[DONE]":
+                            try:
+                                content = orjson.loads(payload)["choices"][0]["delta"].get("content")
+                                if content:
+                                    result_parts.append(content)
+                                    if encoder is not None:
+                                        response_tokens += count_text_tokens(encoder, content)
+                            except (orjson.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+                                pass
                     yield chunk
 
+                result_text = "".join(result_parts)
+
                 # 스트리밍 완료 후 응답 토큰 계산 및 사용량 기록
-                if result_text:
-                    response_tokens = ChatInterface.count_tokens(vendor, model, [{"role": "assistant", "content": result_text}])
-                    total_tokens = request_tokens + response_tokens
-                    print(f"[DEBUG] Response tokens: {response_tokens}, Total tokens: {total_tokens}")
-                    record_usage(total_tokens, result_text)
-                else:
-                    print(f"[WARNING] No response text in streaming, recording request tokens only")
-                    record_usage(request_tokens, "")
+                if ACCOUNTING_ENABLED:
+                    request_tokens = await request_tokens_task
+                    if result_text:
+                        if encoder is None:
+                            response_tokens = count_text_tokens(None, result_text)
+                        total_tokens = request_tokens + response_tokens
+                        logger.debug("Response tokens: %s, Total tokens: %s", response_tokens, total_tokens)
+                        record_usage(request_tokens, total_tokens, result_text)
+                    else:
+                        logger.warning("No response text in streaming, recording request tokens only")
+                        record_usage(request_tokens, request_tokens, "")
 
                 if ENV != "production":
                     try:
-                        cache.update(prompt, llm_string, [Generation(text=result_text)])
+                        update_cached_response(prompt_key, llm_string, result_text)
                     except Exception as e:
-                        print(f"[cache error] {e}")
+                        logger.warning("Failed to update response cache: %s", e)
 
-            return StreamingResponse(streaming_response(), media_type="text/event-stream")
+            return client.sse_response(streaming_response())
 
         else:
             response = await client.invoke(messages=lc_messages, model=model, modelConfig=modelConfig)
+            # 다른 요청이 시작한 업스트림 호출을 공유받았으면 사용량은 그 요청에서 이미 기록됨
+            shared_response = response.pop(BaseClient.SHARED_RESPONSE_FLAG, False)
             
-            # 비스트리밍 응답에서 텍스트 추출 및 토큰 계산
-            try:
-                response_text = ""
-                if "choices" in response and len(response["choices"]) > 0:
-                    if "message" in response["choices"][0]:
-                        response_text = response["choices"][0]["message"].get("content", "")
-                    elif "text" in response["choices"][0]:
-                        response_text = response["choices"][0]["text"]
-                
-                if response_text:
-                    response_tokens = ChatInterface.count_tokens(vendor, model, [{"role": "assistant", "content": response_text}])
-                    total_tokens = request_tokens + response_tokens
-                    print(f"[DEBUG] Response tokens: {response_tokens}, Total tokens: {total_tokens}")
-                    record_usage(total_tokens, response_text)
-                else:
-                    print(f"[WARNING] No response text found, recording request tokens only")
-                    record_usage(request_tokens, "")
-            except Exception as e:
-                print(f"[ERROR] Failed to calculate response tokens: {e}")
-                record_usage(request_tokens, "")
+            # 비스트리밍 응답에서 텍스트 추출
+            response_text = ""
+            if "choices" in response and len(response["choices"]) > 0:
+                if "message" in response["choices"][0]:
+                    response_text = response["choices"][0]["message"].get("content", "")
+                elif "text" in response["choices"][0]:
+                    response_text = response["choices"][0]["text"]
+
+            if ACCOUNTING_ENABLED and shared_response:
+                request_tokens_task.cancel()
+            elif ACCOUNTING_ENABLED:
+                request_tokens = await request_tokens_task
+                try:
+                    if response_text:
+                        # 제공자가 사용량을 돌려준 경우 다시 토큰화하지 않음
+                        usage_info = response.get("usage")
+                        if usage_info and "completion_tokens" in usage_info:
+                            response_tokens = usage_info["completion_tokens"]
+                        else:
+                            response_tokens = count_text_tokens(get_response_encoder(model), response_text)
+                        total_tokens = request_tokens + response_tokens
+                        logger.debug("Response tokens: %s, Total tokens: %s", response_tokens, total_tokens)
+                        record_usage(request_tokens, total_tokens, response_text)
+                    else:
+                        logger.warning("No response text found, recording request tokens only")
+                        record_usage(request_tokens, request_tokens, "")
+                except Exception as e:
+                    logger.error("Failed to calculate response tokens: %s", e)
+                    record_usage(request_tokens, request_tokens, "")
 
             if ENV != "production":
                 try:
-                    cache.update(prompt, llm_string, [Generation(text=response_text)])
+                    update_cached_response(prompt_key, llm_string, response_text)
                 except Exception as e:
-                    print(f"[cache error] {e}")
+                    logger.warning("Failed to update response cache: %s", e)
 
-            return response
+            # FastAPI 기본 인코더(jsonable_encoder + json) 대신 orjson으로 바로 직렬화
+            return ORJSONResponse(response)
 
     @staticmethod
     def count_tokens(vendor: str, model: str, messages: List[Dict[str, Any]]):
+        client = ClientFactory.get_client(vendor)
+        lc_messages = LangchainMessageFactory.create_messages(messages)
+        return ChatInterface.count_tokens_lc(client, lc_messages, model)
+
+    @staticmethod
+    def count_tokens_lc(client: BaseClient, lc_messages: List[BaseMessage], model: str):
+        """이미 생성된 클라이언트와 Langchain 메시지로 토큰 수를 계산합니다."""
         try:
-            client = ClientFactory.get_client(vendor)
-            lc_messages = LangchainMessageFactory.create_messages(messages)
-            token_count = client.get_num_tokens_from_messages(
-                messages=lc_messages,
-                model=model
-            )
-            print(f"[DEBUG] Token count for {vendor}:{model}: {token_count}")
+            cache_key = build_token_count_key(client.vendor, model, lc_messages)
+            with _token_count_cache_lock:
+                token_count = _token_count_cache.get(cache_key)
+            if token_count is None:
+                token_count = client.get_num_tokens_from_messages(
+                    messages=lc_messages,
+                    model=model
+                )
+                with _token_count_cache_lock:
+                    _token_count_cache[cache_key] = token_count
+            logger.debug("Token count for %s:%s: %s", client.vendor, model, token_count)
             return token_count
         except Exception as e:
-            print(f"[ERROR] Failed to count tokens for {vendor}:{model}: {str(e)}")
+            logger.error("Failed to count tokens for %s:%s: %s", client.vendor, model, e)
             # 토큰 계산 실패 시 대략적인 추정값 반환
-            total_chars = sum(len(str(msg.get('content', ''))) for msg in messages)
+            total_chars = sum(len(str(msg.content)) for msg in lc_messages)
             estimated_tokens = total_chars // 4  # 대략적인 추정 (4글자 ≈ 1토큰)
-            print(f"[DEBUG] Using estimated token count: {estimated_tokens}")
+            logger.debug("Using estimated token count: %s", estimated_tokens)
             return estimated_tokens
         
     @staticmethod
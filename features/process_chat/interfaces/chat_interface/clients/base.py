@@ -1,23 +1,87 @@
 import abc
-import json
+import asyncio
+import functools
 import os
-from typing import List, Dict, Any, AsyncGenerator
-from datetime import datetime
+import secrets
+import time
+import httpx
+import orjson
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from fastapi.responses import StreamingResponse
 from langchain.schema import BaseMessage
 
-class BaseClient(abc.ABC):
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+# 이 시간 안에 도착한 스트림 델타는 하나의 SSE 프레임으로 병합
+STREAM_COALESCE_WINDOW_SECONDS = 0.015
+_STREAM_END = object()
+# 클라이언트가 느릴 때 업스트림 델타를 최대 이만큼 버퍼링 (초과 시 업스트림 수신 대기)
+STREAM_BUFFER_MAX_SIZE = 256
+
+# API 키 없이 호출하는 vendor (로컬 Ollama 등)
+_NO_AUTH_VENDORS = frozenset({"ollama"})
+
+@functools.lru_cache(maxsize=16)
+def _vendor_token(vendor: str) -> Optional[str]:
+    if vendor in _NO_AUTH_VENDORS:
+        return None
+    return os.getenv(f"{vendor.upper()}_API_KEY")
+
+class BaseClient:
+    """
+    모든 vendor 클라이언트의 기반 클래스.
+    ABCMeta 대신 __init_subclass__에서 추상 메서드 구현 여부를 클래스 생성 시 한 번만 검사합니다.
+    중간 기반 클래스는 `abstract=True`로 선언합니다.
+    """
+    # SSE 프레임 중 요청/청크와 무관한 부분은 미리 직렬화
+    _DONE_FRAME = b"data: [DONE]\n\n"
+    _ERROR_FRAME = b'data: {"error":{"message":"Upstream stream failed","type":"server_error"}}\n\n'
+    _STREAM_FRAME_SUFFIX = b'},"index":0,"finish_reason":null}]}\n\n'
+    # 진행 중인 동일 호출의 결과를 공유받은 비스트리밍 응답 표시 (사용량 중복 기록 방지용, 응답 전에 제거)
+    SHARED_RESPONSE_FLAG = "_shared"
+    # 프록시(nginx 등)가 SSE 응답을 버퍼링하지 않도록 지정
+    _SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # 모든 vendor 클라이언트가 공유하는 HTTP/2 커넥션 풀
+    _shared_http: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def get_shared_http_client(cls) -> httpx.AsyncClient:
+        if BaseClient._shared_http is None:
+            BaseClient._shared_http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=256, max_keepalive_connections=128),
+                timeout=httpx.Timeout(600.0, connect=10.0)
+            )
+        return BaseClient._shared_http
+
+    def __init_subclass__(cls, abstract: bool = False, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if abstract:
+            return
+        missing = [
+            name for name in dir(cls)
+            if getattr(getattr(cls, name, None), "__isabstractmethod__", False)
+        ]
+        if missing:
+            raise TypeError(f"{cls.__name__} must implement abstract methods: {', '.join(sorted(missing))}")
+
     def __init__(self, vendor: str):
         self.vendor = vendor
-        self.token = os.getenv(f"{vendor.upper()}_API_KEY")
-        self.response_id = self._generate_response_id()
+        self.token = _vendor_token(vendor)
+        # vendor별 동시 업스트림 호출 수 제한 (공유 커넥션 풀 고갈 및 rate limit 방지)
+        self._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    @classmethod
+    def sse_response(cls, frames: AsyncGenerator[bytes, None]) -> StreamingResponse:
+        """이미 SSE 형식으로 직렬화된 바이트 프레임을 그대로 내보내는 응답"""
+        return StreamingResponse(frames, media_type="text/event-stream", headers=cls._SSE_HEADERS)
 
     def _generate_response_id(self) -> str:
-        return f"chatcmpl-{datetime.now().timestamp()}"
+        # 동시에 들어온 요청끼리 충돌하지 않도록 짧은 난수 접미사를 붙임
+        return f"chatcmpl-{time.monotonic_ns():x}{secrets.token_hex(3)}"
 
-    def _format_non_stream_response(self, content: str) -> Dict[str, Any]:
-        return {
-            "id": self.response_id,
+    def _format_non_stream_response(self, content: str, usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        response = {
+            "id": self._generate_response_id(),
             "choices": [
                 {
                     "message": {"role": "assistant", "content": content},
@@ -26,22 +90,22 @@ class BaseClient(abc.ABC):
                 }
             ]
         }
+        if usage:
+            response["usage"] = usage
+        return response
 
-    def _format_stream_chunk(self, chunk_content: str) -> str:
-        data = {
-            "id": self.response_id,
-            "choices": [
-                {
-                    "delta": {"content": chunk_content},
-                    "index": 0,
-                    "finish_reason": None
-                }
-            ]
-        }
-        return f"data: {json.dumps(data)}\n\n"
+    def _format_stream_prefix(self, response_id: str) -> bytes:
+        """응답 id까지 포함한 스트림 프레임 앞부분 (요청당 한 번 생성)"""
+        return b'data: {"id":' + orjson.dumps(response_id) + b',"choices":[{"delta":{"content":'
 
-    def _format_stream_done(self) -> str:
-        return "data: [DONE]\n\n"
+    def _format_stream_chunk(self, chunk_content: str, frame_prefix: bytes) -> bytes:
+        return frame_prefix + orjson.dumps(chunk_content) + self._STREAM_FRAME_SUFFIX
+
+    def _format_stream_done(self) -> bytes:
+        return self._DONE_FRAME
+
+    def _format_stream_error(self) -> bytes:
+        return self._ERROR_FRAME
 
     @abc.abstractmethod
     async def invoke(self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]) -> Dict[str, Any]:
@@ -64,10 +128,58 @@ class BaseClient(abc.ABC):
         pass
 
     async def stream_response(self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]) -> StreamingResponse:
+        # 클라이언트 인스턴스는 요청 간 공유되므로 응답 id는 요청마다 생성
+        frame_prefix = self._format_stream_prefix(self._generate_response_id())
+
+        async def produce(queue: asyncio.Queue):
+            # 업스트림 수신은 클라이언트 전송 속도와 분리된 별도 task에서 수행
+            try:
+                async for chunk_content in self._stream_logic(messages, model, modelConfig):
+                    if chunk_content:
+                        await queue.put(chunk_content)
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(_STREAM_END)
+
         async def generator():
-            async for chunk_content in self._stream_logic(messages, model, modelConfig):
-                if chunk_content:
-                    yield self._format_stream_chunk(chunk_content)
-            yield self._format_stream_done()
+            # 토큰마다 호출되므로 메서드 조회를 루프 밖에서 한 번만 수행
+            format_stream_chunk = self._format_stream_chunk
+            queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_MAX_SIZE)
+            producer = asyncio.create_task(produce(queue))
+            first_frame = True
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is _STREAM_END:
+                        break
+                    if isinstance(item, Exception):
+                        # 이미 응답이 시작되어 상태 코드를 바꿀 수 없으므로 오류 프레임을 보낸 뒤 종료
+                        yield self._format_stream_error()
+                        raise item
+                    # 첫 프레임은 바로 보내고, 이후에는 짧은 시간 동안 도착한 델타를 하나의 프레임으로 병합
+                    if not first_frame:
+                        await asyncio.sleep(STREAM_COALESCE_WINDOW_SECONDS)
+                    first_frame = False
+                    parts = [item]
+                    ended = False
+                    while not queue.empty():
+                        item = queue.get_nowait()
+                        if item is _STREAM_END:
+                            ended = True
+                            break
+                        if isinstance(item, Exception):
+                            yield format_stream_chunk("".join(parts), frame_prefix)
+                            yield self._format_stream_error()
+                            raise item
+                        parts.append(item)
+                    yield format_stream_chunk(parts[0] if len(parts) == 1 else "".join(parts), frame_prefix)
+                    if ended:
+                        break
+                yield self._format_stream_done()
+            finally:
+                # 클라이언트 연결이 끊긴 경우 업스트림 스트림도 중단
+                if not producer.done():
+                    producer.cancel()
 
-        return StreamingResponse(generator(), media_type="text/event-stream")
+        return self.sse_response(generator())
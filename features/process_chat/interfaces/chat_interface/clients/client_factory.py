@@ -1,3 +1,4 @@
+import sys
 from typing import Dict, Type
 
 from .base import BaseClient
@@ -13,11 +14,32 @@ class ClientFactory:
         "google": GoogleClient,
         "ollama": OllamaClient
     }
+    # 클라이언트는 요청별 상태가 없으므로 vendor마다 하나의 인스턴스를 재사용
+    _instances: Dict[str, BaseClient] = {}
+    # 자주 쓰이는 표기 → 정규화된 vendor 키 (요청마다 lower() 하지 않도록)
+    _canonical_vendors: Dict[str, str] = {
+        casing: vendor
+        for vendor in _clients
+        for casing in (vendor, vendor.upper(), vendor.capitalize())
+    }
+
+    @staticmethod
+    def resolve_vendor(vendor: str) -> str:
+        canonical = ClientFactory._canonical_vendors.get(vendor)
+        if canonical is None:
+            canonical = sys.intern(vendor.lower())
+            if canonical in ClientFactory._clients:
+                ClientFactory._canonical_vendors[vendor] = canonical
+        return canonical
 
     @staticmethod
     def get_client(vendor: str) -> BaseClient:
-        client_class = ClientFactory._clients.get(vendor.lower())
-        if not client_class:
-            supported_vendors = ", ".join(ClientFactory._clients.keys())
-            raise ValueError(f"Vendor '{vendor}' is not supported. Supported vendors: {supported_vendors}")
-        return client_class()
\ No newline at end of file
+        vendor_key = ClientFactory.resolve_vendor(vendor)
+        client = ClientFactory._instances.get(vendor_key)
+        if client is None:
+            client_class = ClientFactory._clients.get(vendor_key)
+            if not client_class:
+                supported_vendors = ", ".join(ClientFactory._clients.keys())
+                raise ValueError(f"Vendor '{vendor}' is not supported. Supported vendors: {supported_vendors}")
+            client = ClientFactory._instances[vendor_key] = client_class()
+        return client
\ No newline at end of file
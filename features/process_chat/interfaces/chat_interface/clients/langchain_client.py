@@ -1,61 +1,164 @@
 from .base import BaseClient
-import abc
+from ..factories.message_factory import messages_digest
+import asyncio
+import functools
+import hashlib
 import os
+import orjson
 import sys
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, Dict, Any, AsyncGenerator, Callable, Optional, Tuple
+from cachetools import LRUCache
 from fastapi.responses import StreamingResponse
 from langchain.schema import BaseMessage
-from langchain_core.messages import AIMessageChunk
+from langchain_core.messages import AIMessage, AIMessageChunk
 
 from llm_factory import create_llm, create_embedding
+from llm_cache import is_deterministic
 
-class LangchainClient(BaseClient):
-    def __init__(self, vendor: str):
-        super().__init__(vendor)
+LLM_CACHE_MAX_SIZE = 64
+
+# httpx 클라이언트를 직접 주입할 수 있는 llm_factory 제공자
+SHARED_HTTP_PROVIDERS = ("openai", "azure")
+
+@functools.lru_cache(maxsize=LLM_CACHE_MAX_SIZE)
+def _get_llm(provider: str, model: str, streaming: bool, config_key: bytes) -> Any:
+    # (provider, model, streaming, modelConfig) 조합마다 하나의 LLM 인스턴스를 공유
+    llm_kwargs = orjson.loads(config_key)
+    if provider in SHARED_HTTP_PROVIDERS:
+        llm_kwargs.setdefault("http_async_client", BaseClient.get_shared_http_client())
+    return create_llm(model=model, streaming=streaming, **llm_kwargs)
+
+def get_llm(model: str, streaming: bool = True, modelConfig: Optional[Dict[str, Any]] = None) -> Any:
+    # llm_factory는 LLM_PROVIDER 환경변수로 제공자를 고르므로 캐시 키에도 포함
+    provider = os.getenv("LLM_PROVIDER", "openai")
+    config_key = orjson.dumps(modelConfig or {}, option=orjson.OPT_SORT_KEYS)
+    return _get_llm(provider, model, streaming, config_key)
+
+@functools.lru_cache(maxsize=LLM_CACHE_MAX_SIZE)
+def _get_embedding_client(provider: str, model: str) -> Any:
+    return create_embedding(model=model)
+
+# 동일 텍스트(시스템 프롬프트, 문서 청크 등)의 임베딩을 반복 요청하지 않도록 캐시
+EMBEDDING_CACHE_MAX_SIZE = 10_000
+_embedding_cache: LRUCache = LRUCache(maxsize=EMBEDDING_CACHE_MAX_SIZE)
+
+def build_embedding_cache_key(provider: str, model: str, text: str):
+    return (provider, model, hashlib.blake2b(text.encode(), digest_size=16).digest())
+
+# 진행 중인 비스트리밍 호출 (요청 키 → 업스트림 호출 task)
+_inflight_invokes: Dict[tuple, asyncio.Future] = {}
+
+def build_invoke_key(model: str, config_key: bytes, messages: List[BaseMessage]):
+    return (
+        os.getenv("LLM_PROVIDER", "openai"),
+        model,
+        config_key,
+        messages_digest(messages)
+    )
+
+def _get_content(message: Any) -> str:
+    return message.content
+
+def _get_text(text: str) -> str:
+    return text
 
-    @abc.abstractmethod
-    def _get_langchain_llm_class(self) -> Any:
-        pass
+# 응답 타입별 텍스트 추출 함수 (처음 보는 하위 타입은 isinstance로 해석한 뒤 등록)
+_STREAM_CHUNK_HANDLERS: Dict[type, Callable[[Any], str]] = {str: _get_text, AIMessageChunk: _get_content}
+_INVOKE_RESPONSE_HANDLERS: Dict[type, Callable[[Any], str]] = {str: _get_text, AIMessage: _get_content}
 
-    @abc.abstractmethod
-    def _get_langchain_embedding_class(self) -> Any:
-        pass
+def _resolve_handler(handlers: Dict[type, Callable[[Any], str]], value: Any, base_types: tuple) -> Optional[Callable[[Any], str]]:
+    value_type = type(value)
+    if isinstance(value, str):
+        handler = _get_text
+    elif isinstance(value, base_types):
+        handler = _get_content
+    else:
+        return None
+    handlers[value_type] = handler
+    return handler
+
+class LangchainClient(BaseClient, abstract=True):
+    def __init__(self, vendor: str):
+        super().__init__(vendor)
 
     async def invoke(
         self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]
     ) -> Dict[str, Any]:
-        # 공통 팩토리를 사용하여 LLM 생성
-        from llm_factory import create_llm
-        llm = create_llm(model=model, streaming=False, **modelConfig)
-        response = await llm.ainvoke(messages)
-        return self._format_non_stream_response(
-            self._process_invoke_response(response)
-        )
+        config_key = orjson.dumps(modelConfig or {}, option=orjson.OPT_SORT_KEYS)
+        # 샘플링 요청(temperature>0 또는 미지정)은 요청마다 다른 응답이어야 하므로 공유하지 않음
+        if not is_deterministic(config_key.decode()):
+            content, usage = await self._invoke_upstream(messages, model, modelConfig)
+            return self._format_non_stream_response(content, usage)
+
+        # 동시에 들어온 동일 결정적 요청은 업스트림 호출 하나를 공유
+        invoke_key = build_invoke_key(model, config_key, messages)
+        task = _inflight_invokes.get(invoke_key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(self._invoke_upstream(messages, model, modelConfig))
+            _inflight_invokes[invoke_key] = task
+            task.add_done_callback(lambda _: _inflight_invokes.pop(invoke_key, None))
+        # 한 요청이 취소되어도 같은 호출을 기다리는 다른 요청에는 영향이 없도록 shield
+        content, usage = await asyncio.shield(task)
+        # 응답 id는 요청마다 달라야 하므로 포맷은 호출자별로 수행
+        response = self._format_non_stream_response(content, usage)
+        if shared:
+            # 사용량은 업스트림 호출을 시작한 요청에서만 기록
+            response[self.SHARED_RESPONSE_FLAG] = True
+        return response
+
+    async def _invoke_upstream(
+        self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]
+    ) -> Tuple[str, Optional[Dict[str, int]]]:
+        # 공통 팩토리로 생성한 LLM을 재사용
+        llm = get_llm(model, streaming=False, modelConfig=modelConfig)
+        async with self._semaphore:
+            response = await llm.ainvoke(messages)
+        return self._process_invoke_response(response), self._extract_usage(response)
+
+    def _extract_usage(self, response: Any) -> Optional[Dict[str, int]]:
+        # 제공자가 돌려준 토큰 사용량을 OpenAI 형식으로 변환
+        usage_metadata = getattr(response, "usage_metadata", None)
+        if not usage_metadata:
+            return None
+        return {
+            "prompt_tokens": usage_metadata.get("input_tokens", 0),
+            "completion_tokens": usage_metadata.get("output_tokens", 0),
+            "total_tokens": usage_metadata.get("total_tokens", 0)
+        }
 
     def _process_invoke_response(self, response: Any) -> str:
-        if isinstance(response, str):
-            return response
-        elif isinstance(response, BaseMessage):
-            return response.content
-        else:
+        handler = _INVOKE_RESPONSE_HANDLERS.get(type(response)) or _resolve_handler(
+            _INVOKE_RESPONSE_HANDLERS, response, (BaseMessage,)
+        )
+        if handler is None:
             raise ValueError(f"Unsupported response type: {type(response)}")
+        return handler(response)
 
     async def _stream_logic(
         self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]
     ) -> AsyncGenerator[str, None]:
-        # 공통 팩토리를 사용하여 LLM 생성
-        from llm_factory import create_llm
-        llm = create_llm(model=model, streaming=True, **modelConfig)
-        async for chunk in llm.astream(messages):
-            yield self._process_stream_chunk(chunk)
+        # 공통 팩토리로 생성한 LLM을 재사용
+        llm = get_llm(model, streaming=True, modelConfig=modelConfig)
+        process_stream_chunk = self._process_stream_chunk
+        async with self._semaphore:
+            async for chunk in llm.astream(messages):
+                # 채팅 모델은 항상 AIMessageChunk를 반환하므로 메서드 호출 없이 바로 content 사용
+                if type(chunk) is AIMessageChunk:
+                    content = chunk.content
+                else:
+                    content = process_stream_chunk(chunk)
+                # 역할만 담긴 첫 청크나 tool call 청크처럼 내용이 빈 델타는 여기서 버림
+                if content:
+                    yield content
     
     def _process_stream_chunk(self, chunk: Any) -> str:
-        if isinstance(chunk, str):
-            return chunk
-        elif isinstance(chunk, AIMessageChunk):
-            return chunk.content
-        else:
+        handler = _STREAM_CHUNK_HANDLERS.get(type(chunk)) or _resolve_handler(
+            _STREAM_CHUNK_HANDLERS, chunk, (AIMessageChunk,)
+        )
+        if handler is None:
             raise ValueError(f"Unsupported chunk type: {type(chunk)}")
+        return handler(chunk)
 
     async def stream(
         self, messages: List[BaseMessage], model: str, modelConfig: Dict[str, Any]
@@ -64,19 +167,25 @@ class LangchainClient(BaseClient):
 
     def get_num_tokens_from_messages(self, messages: List[BaseMessage], model: str) -> int:
         try:
-            # 공통 팩토리를 사용하여 LLM 생성
-            from llm_factory import create_llm
-            llm = create_llm(model=model)
+            # 공통 팩토리로 생성한 LLM을 재사용
+            llm = get_llm(model)
             return llm.get_num_tokens_from_messages(messages=messages)
         except Exception as e:
             raise RuntimeError(f"Langchain get_num_tokens failed: {str(e)}")
 
     async def get_embedding(self, text: str, model: str) -> List[float]:
         try:
+            provider = os.getenv("LLM_PROVIDER", "openai")
+            cache_key = build_embedding_cache_key(provider, model, text)
+            cached_vector = _embedding_cache.get(cache_key)
+            if cached_vector is not None:
+                return list(cached_vector)
+
             # 공통 팩토리를 사용하여 embedding 생성
             # 현재 제공자에 맞는 embedding을 자동으로 선택
-            embedding_client = create_embedding(model=model)
+            embedding_client = _get_embedding_client(provider, model)
             embedding_vector = await embedding_client.aembed_query(text)
+            _embedding_cache[cache_key] = tuple(embedding_vector)
             return embedding_vector
         except Exception as e:
             raise RuntimeError(f"Failed to get embedding: {str(e)}")
\ No newline at end of file
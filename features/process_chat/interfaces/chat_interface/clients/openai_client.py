@@ -1,13 +1,38 @@
 from .langchain_client import LangchainClient
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from typing import Any
+from langchain.schema import BaseMessage
+from typing import List
+import functools
+import tiktoken
+
+# ChatOpenAI.get_num_tokens_from_messages와 같은 역할 매핑 (문자열 content 메시지만 직접 계산)
+_OPENAI_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_REPLY_PRIMING = 3
+
+@functools.lru_cache(maxsize=32)
+def _get_encoding(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        if model.startswith(("gpt-4o", "gpt-4.1")):
+            return tiktoken.get_encoding("o200k_base")
+        return tiktoken.get_encoding("cl100k_base")
 
 class OpenAIClient(LangchainClient):
     def __init__(self):
         super().__init__("openai")
 
-    def _get_langchain_llm_class(self) -> Any:
-        return ChatOpenAI
+    def get_num_tokens_from_messages(self, messages: List[BaseMessage], model: str) -> int:
+        # 일반 텍스트 대화는 LLM 객체를 거치지 않고 tiktoken으로 직접 계산 (ChatOpenAI와 동일한 공식)
+        if not model.startswith(("gpt-3.5-turbo", "gpt-4")) or model.startswith("gpt-3.5-turbo-0301"):
+            return super().get_num_tokens_from_messages(messages, model)
 
-    def _get_langchain_embedding_class(self) -> Any:
-        return OpenAIEmbeddings
\ No newline at end of file
+        encoding = _get_encoding(model)
+        num_tokens = _TOKENS_REPLY_PRIMING
+        for message in messages:
+            role = _OPENAI_ROLES.get(message.type)
+            content = message.content
+            if role is None or not isinstance(content, str) or message.additional_kwargs:
+                return super().get_num_tokens_from_messages(messages, model)
+            num_tokens += _TOKENS_PER_MESSAGE + len(encoding.encode(role)) + len(encoding.encode(content))
+        return num_tokens
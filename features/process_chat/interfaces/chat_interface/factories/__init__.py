@@ -1,5 +1,7 @@
-from .message_factory import LangchainMessageFactory
+from .message_factory import LangchainMessageFactory, PreparedMessages, messages_digest
 
 __all__ = [
-    "LangchainMessageFactory"
+    "LangchainMessageFactory",
+    "PreparedMessages",
+    "messages_digest"
 ]
\ No newline at end of file
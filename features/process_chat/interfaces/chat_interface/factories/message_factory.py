@@ -1,9 +1,45 @@
+import hashlib
+import logging
+import orjson
 from typing import List, Dict, Any
 from langchain.schema import HumanMessage, SystemMessage, AIMessage, BaseMessage
 
+logger = logging.getLogger(__name__)
+
+class PreparedMessages(list):
+    """
+    변환된 Langchain 메시지 목록.
+    토큰 수 캐시, 동일 요청 병합 등 여러 곳에서 쓰는 내용 해시를 한 번만 계산해 보관합니다.
+    """
+    __slots__ = ("_digest",)
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        self._digest = None
+
+    @property
+    def digest(self) -> bytes:
+        if self._digest is None:
+            self._digest = compute_messages_digest(self)
+        return self._digest
+
+def compute_messages_digest(messages: List[BaseMessage]) -> bytes:
+    return hashlib.blake2b(orjson.dumps([(msg.type, msg.content) for msg in messages]), digest_size=16).digest()
+
+def messages_digest(messages: List[BaseMessage]) -> bytes:
+    if isinstance(messages, PreparedMessages):
+        return messages.digest
+    return compute_messages_digest(messages)
+
+_ROLE_TO_MESSAGE_CLASS = {
+    "user": HumanMessage,
+    "system": SystemMessage,
+    "assistant": AIMessage,
+}
+
 class LangchainMessageFactory:
     @staticmethod
-    def create_messages(messages: List[Dict[str, Any]]) -> List[BaseMessage]:
+    def create_messages(messages: List[Dict[str, Any]]) -> PreparedMessages:
         """
         Creates Langchain message objects from a list of dictionaries.
 
@@ -13,25 +49,22 @@ class LangchainMessageFactory:
 
         Returns:
             A list of Langchain BaseMessage objects (HumanMessage,
-            SystemMessage, or AIMessage).
+            SystemMessage, or AIMessage). Unsupported roles are treated
+            as user messages.
         """
-        lc_messages = []
+        lc_messages = PreparedMessages()
         for msg in messages:
             role = msg.get("role")
             content = msg.get("content")
 
             if not role or not content:
-                print(f"Warning: Skipping message due to missing role or content: {msg}")
+                logger.warning("Skipping message due to missing role or content: %s", msg)
                 continue
 
-            if role == "user":
-                lc_messages.append(HumanMessage(content=content))
-            elif role == "system":
-                lc_messages.append(SystemMessage(content=content))
-            elif role == "assistant":
-                lc_messages.append(AIMessage(content=content))
-            else:
-                print(f"Warning: Unsupported role '{role}' encountered. Treating as user message.")
-                lc_messages.append(HumanMessage(content=content))
+            message_class = _ROLE_TO_MESSAGE_CLASS.get(role)
+            if message_class is None:
+                logger.warning("Unsupported role '%s' encountered. Treating as user message.", role)
+                message_class = HumanMessage
+            lc_messages.append(message_class(content=content))
 
         return lc_messages
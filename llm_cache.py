@@ -0,0 +1,65 @@
+import os
+import re
+
+from langchain_community.cache import SQLAlchemyCache
+from langchain.globals import set_llm_cache
+from sqlalchemy import create_engine, event
+
+from database import subdomain_var
+
+# llm_string은 직렬화된 모델 설정(JSON: "temperature": 0.0) 또는 파라미터 목록(('temperature', 0.0)) 형태
+TEMPERATURE_PATTERN = re.compile(r"""["']temperature["']\s*[:,]\s*([-+0-9.eE]+)""")
+
+
+def is_deterministic(llm_string: str) -> bool:
+    """temperature=0으로 명시된 호출만 결정적인 응답으로 보고 캐시 대상으로 삼음
+    temperature가 없으면 공급자 기본값(샘플링)이 적용되므로 캐시하지 않음
+    """
+    match = TEMPERATURE_PATTERN.search(llm_string)
+    if not match:
+        return False
+    try:
+        return float(match.group(1)) == 0
+    except ValueError:
+        return False
+
+
+class TenantScopedLLMCache(SQLAlchemyCache):
+    """
+    테넌트별로 분리되고 결정적인 호출만 저장하는 LLM 캐시.
+    샘플링된 응답(temperature>0)은 저장/조회하지 않고, 키(llm_string)에 요청의 테넌트를 포함해
+    다른 테넌트의 응답이 재사용되지 않도록 합니다.
+    """
+    def scoped_llm_string(self, llm_string: str) -> str:
+        return f"tenant={subdomain_var.get()}---{llm_string}"
+
+    def lookup(self, prompt, llm_string):
+        if not is_deterministic(llm_string):
+            return None
+        return super().lookup(prompt, self.scoped_llm_string(llm_string))
+
+    def update(self, prompt, llm_string, return_val):
+        if not is_deterministic(llm_string):
+            return
+        super().update(prompt, self.scoped_llm_string(llm_string), return_val)
+
+
+def setup_llm_cache():
+    """SQLite LLM 캐시를 생성해 전역 캐시로 등록 (앱 시작 시 한 번 호출)
+    WAL 모드로 읽기와 쓰기가 서로 막지 않도록 설정
+    """
+    # .env 로드 이후에 경로를 읽도록 호출 시점에 결정
+    cache_path = os.getenv("LLM_CACHE_PATH", "/data/.langchain.db" if os.getenv("ENV") == "production" else ".langchain.db")
+    engine = create_engine(f"sqlite:///{cache_path}")
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    set_llm_cache(TenantScopedLLMCache(engine))
+    return engine
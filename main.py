@@ -2,9 +2,14 @@ import os
 
 os.environ["PYTHONIOENCODING"] = "utf-8"
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder
+import zlib
 from process_db_manager import add_routes_to_app as add_db_manager_routes_to_app
 from process_engine import add_routes_to_app as add_process_routes_to_app
 from process_image import add_routes_to_app as add_image_routes_to_app
@@ -14,6 +19,7 @@ from min import add_routes_to_app as add_min_routes_to_app
 from process_def_search import add_routes_to_app as add_process_def_search_routes_to_app
 from process_chat import add_routes_to_app as add_process_chat_routes_to_app
 from database import update_tenant_id
+from llm_cache import setup_llm_cache
 # notification_polling_task는 FCM 서비스로 분리됨
 from mcp_config_api import add_routes_to_app as add_mcp_routes_to_app
 from agent_chat import add_routes_to_app as add_agent_chat_routes_to_app
@@ -22,10 +28,6 @@ from dotenv import load_dotenv
 
 if os.getenv("ENV") != "production":
     load_dotenv(override=True)
-    # 캐시 적용
-    from langchain.cache import SQLiteCache
-    from langchain.globals import set_llm_cache
-    set_llm_cache(SQLiteCache(database_path=".langchain.db"))
 
 os.environ["LANGSMITH_TRACING"] = "true"
 os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
@@ -35,8 +37,16 @@ app = FastAPI(
     title="LangChain Server",
     version="1.0",
     description="A simple api server using Langchain's Runnable interfaces",
+    default_response_class=ORJSONResponse,
 )
 
+
+@app.on_event("startup")
+def init_llm_cache():
+    # 캐시 엔진은 import 시점이 아니라 앱 시작 시 생성 (테넌트별, temperature=0 호출만 캐시)
+    app.state.llm_cache_engine = setup_llm_cache()
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 모든 출처 허용
@@ -45,27 +55,146 @@ app.add_middleware(
     allow_headers=["*"],  # 모든 HTTP 헤더 허용
 )
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from database import update_tenant_id
 
-class DBConfigMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        host_name = request.headers.get('X-Forwarded-Host')
-        if host_name is None or any(substring in host_name for substring in ['localhost']):
+class DBConfigMiddleware:
+    """
+    X-Forwarded-Host의 서브도메인으로 테넌트를 설정하는 ASGI 미들웨어.
+    BaseHTTPMiddleware와 달리 Request 객체나 응답 스트림 중계 task를 만들지 않습니다.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        host_name = None
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-host":
+                host_name = value
+                break
+        # 헤더 바이트에서 바로 판별하고 서브도메인(첫 라벨)만 디코딩
+        if host_name is None or b"localhost" in host_name:
             subdomain = 'localhost'
         else:
-            subdomain = host_name.split('.')[0]
-            
+            subdomain = host_name.split(b'.', 1)[0].decode("latin-1")
+
+        # 테넌트는 요청별 ContextVar이므로 요청마다 설정해야 함 (이전 요청 값 재사용 불가)
         await update_tenant_id(subdomain)
         # 요청을 다음 미들웨어 또는 엔드포인트로 전달
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
+
+
+class SSEHeadersMiddleware:
+    """
+    text/event-stream 응답에 프록시 버퍼링/캐시 방지 헤더를 붙이는 ASGI 미들웨어.
+    LangServe의 /stream 등 헤더를 직접 지정하지 않는 SSE 응답에도 적용되며, 이미 지정된 헤더는 덮어쓰지 않습니다.
+    """
+    SSE_HEADERS = ((b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no"))
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                raw_headers = message.get("headers", [])
+                names = {name.lower() for name, _ in raw_headers}
+                is_sse = any(
+                    name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in raw_headers
+                )
+                if is_sse:
+                    message["headers"] = [*raw_headers, *(h for h in self.SSE_HEADERS if h[0] not in names)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class SSECompressionMiddleware:
+    """
+    지정한 경로의 text/event-stream 응답만 gzip으로 압축하는 ASGI 미들웨어.
+    프레임마다 Z_SYNC_FLUSH로 내보내므로 압축 때문에 토큰 전송이 지연되지 않습니다.
+    짧은 토큰 델타 스트림은 프레임마다 붙는 flush 오버헤드가 절감분을 상쇄하므로 압축하지 않고,
+    마지막에 전체 답변(content/html_content)을 다시 보내는 multi-agent 스트림만 대상으로 합니다.
+    (그 외 응답은 JSONHTMLGZipMiddleware 대상이며, 그쪽은 SSE를 제외함)
+    """
+    def __init__(self, app, compresslevel: int = 1, path_prefixes: tuple = ("/multi-agent/",)):
+        self.app = app
+        self.compresslevel = compresslevel
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value
+                break
+        if b"gzip" not in accept_encoding:
+            await self.app(scope, receive, send)
+            return
+
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal compressor
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if headers.get("content-type", "").startswith("text/event-stream") and "content-encoding" not in headers:
+                    compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+                    headers["Content-Encoding"] = "gzip"
+                    headers.add_vary_header("Accept-Encoding")
+                    if "content-length" in headers:
+                        del headers["content-length"]
+            elif message["type"] == "http.response.body" and compressor is not None:
+                more_body = message.get("more_body", False)
+                body = compressor.compress(message.get("body", b""))
+                body += compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+class JSONHTMLGZipResponder(GZipResponder):
+    """JSON/HTML 응답만 압축하고 나머지(정적 이미지, 폰트 등 이미 압축된 형식)는 그대로 내보내는 GZipResponder"""
+    COMPRESSIBLE_CONTENT_TYPES = ("application/json", "text/html")
+
+    async def send_with_compression(self, message):
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = not content_type.startswith(self.COMPRESSIBLE_CONTENT_TYPES)
+
+
+class JSONHTMLGZipMiddleware(GZipMiddleware):
+    """
+    application/json, text/html 응답만 gzip으로 압축하는 GZipMiddleware.
+    /static의 이미지/폰트처럼 이미 압축된 응답을 다시 압축하지 않습니다. (SSE는 SSECompressionMiddleware가 담당)
+    """
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            await JSONHTMLGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
 
 
 # app.post("/update_db")(update_db)
     
 # 미들웨어 추가
 app.add_middleware(DBConfigMiddleware)
+app.add_middleware(SSEHeadersMiddleware)
+app.add_middleware(SSECompressionMiddleware)
+# 1KB 이상 JSON/HTML 응답만 압축 (text/event-stream은 위 SSE 미들웨어가 담당)
+app.add_middleware(JSONHTMLGZipMiddleware, minimum_size=1024, compresslevel=5)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -80,14 +209,8 @@ add_process_chat_routes_to_app(app)
 add_mcp_routes_to_app(app)
 add_agent_chat_routes_to_app(app)
 
-import asyncio
-
-@app.on_event("startup")
-async def start_background_tasks():
-    # 알림 실시간 구독 태스크 시작
-    # asyncio.create_task(notification_polling_task())
-    pass
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="localhost", port=8000)
\ No newline at end of file
+    # libuv 기반 이벤트 루프(uvloop)와 httptools 파서 사용
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run("main:app" if workers > 1 else app, host="localhost", port=8000, loop="uvloop", http="httptools", workers=workers)
\ No newline at end of file
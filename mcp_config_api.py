@@ -1,17 +1,33 @@
 from fastapi import Request, HTTPException
-import json
-from typing import Dict
+import asyncio
+import orjson
+import os
+from typing import Dict, Optional, Tuple
+
+MCP_CONFIG_PATH = 'mcp.json'
+
+# (파일 수정 시각, mcpServers) - 파일이 바뀌었을 때만 다시 읽음
+_mcp_tools_cache: Optional[Tuple[float, Dict]] = None
 
 def add_routes_to_app(app):
     app.add_api_route("/mcp-tools", load_mcp_tools, methods=["GET"])
-    
-def load_mcp_tools() -> Dict:
+
+def read_mcp_config() -> Dict:
+    with open(MCP_CONFIG_PATH, 'rb') as f:
+        return orjson.loads(f.read())
+
+async def load_mcp_tools() -> Dict:
     """Load and return MCP configuration from mcp.json file."""
+    global _mcp_tools_cache
     try:
-        with open('mcp.json', 'r') as f:
-            mcp_config = json.load(f)
-            return mcp_config.get("mcpServers", {})
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        raise HTTPException(status_code=404, detail=f"Failed to load MCP config: {str(e)}")
+        # 캐시 적중 시에는 stat 한 번이면 되므로 스레드풀을 거치지 않고 이벤트 루프에서 바로 처리
+        mtime = os.stat(MCP_CONFIG_PATH).st_mtime
+        if _mcp_tools_cache is not None and _mcp_tools_cache[0] == mtime:
+            return _mcp_tools_cache[1]
 
-    
\ No newline at end of file
+        mcp_config = await asyncio.to_thread(read_mcp_config)
+        mcp_servers = mcp_config.get("mcpServers", {})
+        _mcp_tools_cache = (mtime, mcp_servers)
+        return mcp_servers
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
+        raise HTTPException(status_code=404, detail=f"Failed to load MCP config: {str(e)}")
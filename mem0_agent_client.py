@@ -1,26 +1,37 @@
-from mem0 import Memory
 from dotenv import load_dotenv
+import asyncio
 import os
-from typing import Dict, List, Optional, Tuple, Any
-import json
+import threading
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+import hashlib
+import orjson
+from dataclasses import dataclass
 from datetime import datetime
+from cachetools import TTLCache
 from langchain.prompts import PromptTemplate
 from langchain.schema.output_parser import StrOutputParser
-from langchain.schema.runnable import RunnablePassthrough
 from fastapi import HTTPException
 from database import fetch_chat_history
 from llm_factory import create_llm
+from fcm_service.queue_logging import setup_queue_logging
 
 if os.getenv("ENV") != "production":
     load_dotenv(override=True)
 
+# mem0 에이전트 로그 설정
+logger = setup_queue_logging("mem0_agent")
+
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
-connection_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# mem0(supabase/vecs)는 SQLAlchemy 커넥션 풀을 재사용하므로 유휴 커넥션이 끊겨도 빨리 감지하도록 TCP keepalive 설정
+connection_string = (
+    f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    "?connect_timeout=10&keepalives=1&keepalives_idle=30&keepalives_interval=10&keepalives_count=3"
+)
 
 # LLM 객체 생성 (공통 팩토리 사용)
 llm = create_llm(model="gpt-4o", streaming=True)
@@ -114,85 +125,170 @@ config = {
     }
 }
 
-memory = Memory.from_config(config_dict=config)
+_memory = None
+_memory_lock = threading.Lock()
+
+def get_memory():
+    """mem0 Memory는 DB 연결과 임베딩 설정을 초기화하므로 첫 사용 시점에 한 번만 생성"""
+    global _memory
+    if _memory is None:
+        # 동시에 들어온 첫 요청들이 Memory(커넥션 풀)를 중복 생성하지 않도록 잠금 후 재확인
+        with _memory_lock:
+            if _memory is None:
+                from mem0 import Memory
+                _memory = Memory.from_config(config_dict=config)
+    return _memory
+
+async def aget_memory():
+    # 최초 생성(DB 연결)도 이벤트 루프를 막지 않도록 워커 스레드에서 수행
+    if _memory is None:
+        return await asyncio.to_thread(get_memory)
+    return _memory
 
+# 입력 dict를 그대로 프롬프트에 넘기므로 앞단의 RunnablePassthrough는 불필요
 intent_chain = (
-    RunnablePassthrough() |
     intent_analysis_prompt |
     llm |
     StrOutputParser()
 )
 
 response_chain = (
-    RunnablePassthrough() |
     response_generation_prompt |
     llm |
     StrOutputParser()
 )
 
-async def analyze_intent(message: str, chat_room_id: str = None) -> Tuple[str, Optional[Dict]]:
+# 동일한 입력(메시지 + 대화 내역/검색 결과)에 대한 LLM 응답 캐시
+LLM_RESPONSE_CACHE_MAX_SIZE = 1024
+LLM_RESPONSE_CACHE_TTL_SECONDS = 3600
+_llm_response_cache: TTLCache = TTLCache(maxsize=LLM_RESPONSE_CACHE_MAX_SIZE, ttl=LLM_RESPONSE_CACHE_TTL_SECONDS)
+
+# 동일한 (에이전트, 질의)에 대한 메모리 검색 결과 캐시
+# 캐시 적중 시 검색 결과(search_context)도 같으므로 이어지는 응답 생성도 위 LLM 응답 캐시에 적중함
+# 아래 세대 카운터는 프로세스 안에서만 공유되므로, 다른 워커/파드에서 저장한 정보는
+# 최대 SEARCH_CACHE_TTL_SECONDS 동안 보이지 않을 수 있음 (짧은 반복 질의 폭주만 흡수하는 용도)
+SEARCH_CACHE_MAX_SIZE = 10_000
+SEARCH_CACHE_TTL_SECONDS = 5
+_search_cache: TTLCache = TTLCache(maxsize=SEARCH_CACHE_MAX_SIZE, ttl=SEARCH_CACHE_TTL_SECONDS)
+# 에이전트별 메모리 세대. 새 정보를 저장하면 증가시켜 같은 프로세스의 이전 검색 결과를 즉시 무효화함
+_memory_generations: Dict[str, int] = {}
+
+def build_search_cache_key(agent_id: str, query: str) -> Tuple[str, int, bytes]:
+    return (agent_id, _memory_generations.get(agent_id, 0), hashlib.blake2b(query.encode(), digest_size=16).digest())
+
+def new_task_id() -> str:
+    # 기존 응답과 같은 형식(float 타임스탬프 문자열) 유지
+    return str(datetime.now().timestamp())
+
+def current_timestamp() -> str:
+    # 기존 메모리 메타데이터와 같은 형식(로컬 시각 ISO 문자열) 유지
+    return datetime.now().isoformat()
+
+def build_chain_cache_key(chain_name: str, inputs: Dict[str, str]) -> Tuple[str, bytes]:
+    return (chain_name, hashlib.sha256(orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS)).digest())
+
+async def invoke_cached_chain(chain_name: str, chain, inputs: Dict[str, str]) -> str:
+    """체인 입력 전체를 해시한 키로 응답을 캐시합니다. 검색 결과가 바뀌면 키도 바뀌므로 새로 학습한 정보가 반영됩니다."""
+    cache_key = build_chain_cache_key(chain_name, inputs)
+    cached = _llm_response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    result = await chain.ainvoke(inputs)
+    _llm_response_cache[cache_key] = result
+    return result
+
+@dataclass(slots=True)
+class IntentInfo:
+    """의도 분석 결과로 얻은 정보"""
+    content: str
+    category: str = "other"
+    confidence: float = 0.9
+    timestamp: str = ""
+
+async def analyze_intent(message: str, chat_room_id: str = None) -> Tuple[str, IntentInfo]:
     """OpenAI를 사용하여 메시지의 의도를 분석합니다."""
     try:
-        chat_history = fetch_chat_history(chat_room_id)
+        # Supabase 조회는 동기 I/O이므로 워커 스레드에서 실행 (ContextVar의 테넌트 정보는 to_thread가 복사해 전달)
+        chat_history = await asyncio.to_thread(fetch_chat_history, chat_room_id)
         if chat_history:
-            chat_history = "\n".join([f"{item.messages.content}" for item in chat_history if item.messages])
+            chat_history = "\n".join(str(item.messages.content) for item in chat_history if item.messages)
         else:
             chat_history = ""
-        result = await intent_chain.ainvoke({"message": message, "chat_history": chat_history})
-        parsed_result = json.loads(result)
+        result = await invoke_cached_chain("intent", intent_chain, {"message": message, "chat_history": chat_history})
+        parsed_result = orjson.loads(result)
         
         intent = parsed_result["intent"]
-        info = {
-            "content": parsed_result["content"],
-            "category": intent,
-            "confidence": 0.9,
-            "timestamp": datetime.now().isoformat()
-        }
-        return intent, info
+        return intent, IntentInfo(
+            content=parsed_result["content"],
+            category=intent,
+            timestamp=current_timestamp()
+        )
         
-    except Exception as e:
-        print(f"OpenAI 분석 중 오류 발생: {str(e)}")
-        return "other", {"content": "죄송합니다. 이해하지 못했습니다. 다시 요청 해주세요."}
+    except Exception:
+        logger.exception("OpenAI 분석 중 오류 발생")
+        return "other", IntentInfo(content="죄송합니다. 이해하지 못했습니다. 다시 요청 해주세요.")
+
+def build_search_context(search_results: List[Dict]) -> str:
+    return "\n".join(f"- {r['memory']} (신뢰도: {r['score']:.2f})" for r in search_results)
 
 async def generate_response(message: str, search_results: List[Dict]) -> str:
     """검색 결과를 활용하여 응답을 생성합니다."""
     try:
-        search_context = "\n".join([f"- {r['memory']} (신뢰도: {r['score']:.2f})" for r in search_results])
-        response = await response_chain.ainvoke({
+        response = await invoke_cached_chain("response", response_chain, {
             "message": message,
-            "search_context": search_context
+            "search_context": build_search_context(search_results)
         })
         return response
                 
-    except Exception as e:
-        print(f"응답 생성 중 오류 발생: {str(e)}")
+    except Exception:
+        logger.exception("응답 생성 중 오류 발생")
         raise
 
-def search_memories(agent_id: str, query: str) -> List[Dict]:
+async def search_memories(agent_id: str, query: str) -> List[Dict]:
     """mem0에서 관련 정보를 검색합니다."""
-    results = memory.search(query, agent_id=agent_id)
-    return results["results"][:5]
+    cache_key = build_search_cache_key(agent_id, query)
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # pgvector 검색은 동기 네트워크 호출이므로 이벤트 루프를 막지 않도록 워커 스레드에서 실행
+    memory = await aget_memory()
+    results = await asyncio.to_thread(memory.search, query, agent_id=agent_id)
+    search_results = results["results"][:5]
+    _search_cache[cache_key] = search_results
+    return search_results
 
-def store_in_memory(agent_id: str, content: str):
+async def store_in_memory(agent_id: str, content: str):
     """유의미한 정보를 mem0에 저장합니다."""
-    memory.add(
+    memory = await aget_memory()
+    await asyncio.to_thread(
+        memory.add,
         content,
         agent_id=agent_id,
         metadata={
             "type": "information",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": current_timestamp()
         },
         infer=False
     )
+    _memory_generations[agent_id] = _memory_generations.get(agent_id, 0) + 1
+
+def parse_query_response(response: str, intent: str) -> Dict[str, Any]:
+    """LLM이 돌려준 JSON 응답을 파싱합니다. JSON이 아니면 본문 전체를 content로 사용합니다."""
+    try:
+        parsed_response = orjson.loads(response)
+    except:
+        parsed_response = {"content": response}
+    parsed_response["type"] = intent
+    return parsed_response
 
 async def process_mem0_message(text: str, agent_id: str, chat_room_id: str = None, is_learning_mode: bool = False):
     """Mem0 에이전트를 통해 메시지를 처리합니다."""
     try:
         if is_learning_mode:
             intent = "information"
-            store_in_memory(agent_id, text)
+            await store_in_memory(agent_id, text)
             return {
-                "task_id": str(datetime.now().timestamp()),
+                "task_id": new_task_id(),
                 "response": {
                     "type": intent,
                     "content": text
@@ -201,20 +297,52 @@ async def process_mem0_message(text: str, agent_id: str, chat_room_id: str = Non
         else:
             intent = "query"
             search_term = text
-            search_results = search_memories(agent_id, search_term)
+            search_results = await search_memories(agent_id, search_term)
             
             response = await generate_response(text, search_results)
-            try:
-                response = json.loads(response)
-            except:
-                response = {"content": response}
-            response["type"] = intent
-            
             return {
-                "task_id": str(datetime.now().timestamp()),
-                "response": response
+                "task_id": new_task_id(),
+                "response": parse_query_response(response, intent)
             }
 
     except Exception as e:
-        print(f"메시지 처리 중 오류 발생: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.exception("메시지 처리 중 오류 발생")
+        raise HTTPException(status_code=500, detail=str(e))
+
+SSE_DONE_FRAME = b"data: [DONE]\n\n"
+
+def format_sse_event(payload: Dict[str, Any]) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+async def stream_mem0_message(text: str, agent_id: str, chat_room_id: str = None, is_learning_mode: bool = False) -> AsyncGenerator[bytes, None]:
+    """
+    process_mem0_message의 스트리밍 버전.
+    생성 중인 답변 조각을 {"type": "delta"} 이벤트로 먼저 보내고, 마지막에 완성된 응답(process_mem0_message와 같은 형식)을 보냅니다.
+    """
+    try:
+        if is_learning_mode:
+            yield format_sse_event(await process_mem0_message(text, agent_id, chat_room_id, is_learning_mode))
+        else:
+            intent = "query"
+            search_results = await search_memories(agent_id, text)
+            inputs = {"message": text, "search_context": build_search_context(search_results)}
+
+            cache_key = build_chain_cache_key("response", inputs)
+            response = _llm_response_cache.get(cache_key)
+            if response is None:
+                parts = []
+                async for chunk in response_chain.astream(inputs):
+                    if chunk:
+                        parts.append(chunk)
+                        yield format_sse_event({"type": "delta", "content": chunk})
+                response = "".join(parts)
+                _llm_response_cache[cache_key] = response
+
+            yield format_sse_event({
+                "task_id": new_task_id(),
+                "response": parse_query_response(response, intent)
+            })
+    except Exception as e:
+        logger.exception("메시지 스트리밍 중 오류 발생")
+        yield format_sse_event({"error": str(e)})
+    yield SSE_DONE_FRAME
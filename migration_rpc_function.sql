@@ -7,8 +7,22 @@ CREATE TABLE proc_def_backup (
     bpmn TEXT NULL,
     tenant_id TEXT NULL,
     isdeleted BOOLEAN DEFAULT FALSE,
+    -- 배치 백업 UPSERT(on_conflict=id,tenant_id) 대상 제약. tenant_id가 NULL인 백업도 id로 중복 판단
+    CONSTRAINT proc_def_backup_id_tenant_key UNIQUE NULLS NOT DISTINCT (id, tenant_id)
 );
 
+-- 커서 기반 배치 조회(WHERE id > cursor ORDER BY id LIMIT n)용 인덱스
+-- 배치마다 전체 스캔 없이 인덱스 탐색으로 다음 배치를 읽도록 함
+-- (운영 중인 큰 테이블에서는 각 문을 별도로 CREATE INDEX CONCURRENTLY로 실행)
+-- proc_def_backup은 위 (id, tenant_id) 유니크 제약의 인덱스를 사용
+CREATE INDEX IF NOT EXISTS idx_proc_def_migration_cursor
+    ON proc_def (id)
+    WHERE isdeleted = false AND definition IS NOT NULL AND bpmn IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_proc_def_migration_tenant_cursor
+    ON proc_def (tenant_id, id)
+    WHERE isdeleted = false AND definition IS NOT NULL AND bpmn IS NOT NULL;
+
 -- 마이그레이션 대상 프로세스 조회를 위한 RPC 함수
 -- lock 테이블에 id가 없거나 user_id가 특정 값인 경우만 반환
 DROP FUNCTION IF EXISTS get_migration_target_processes;
@@ -24,7 +38,8 @@ RETURNS TABLE (
     id TEXT,
     name TEXT,
     definition JSONB,
-    bpmn TEXT
+    bpmn TEXT,
+    tenant_id TEXT
 ) 
 LANGUAGE plpgsql
 AS $$
@@ -34,12 +49,14 @@ BEGIN
         pd.id,
         pd.name,
         pd.definition,
-        pd.bpmn
+        pd.bpmn,
+        pd.tenant_id
     FROM proc_def pd
     LEFT JOIN lock l ON l.id = pd.id AND l.tenant_id = pd.tenant_id
     WHERE 
         pd.isdeleted = false
         AND pd.definition IS NOT NULL
+        AND pd.definition ? 'activities'
         AND pd.bpmn IS NOT NULL
         AND pd.bpmn LIKE '%"inputMapping"%'
         AND (
@@ -62,5 +79,45 @@ BEGIN
 END;
 $$;
 
+-- 마이그레이션된 프로세스를 배치 단위로 저장하는 RPC 함수
+-- migrated_rows: [{"id": ..., "tenant_id": ..., "bpmn": ..., "definition": {...}}, ...]
+-- id는 테넌트별로만 유일하므로 (id, tenant_id) 쌍으로 대상 행을 찾음
+-- 한 번의 UPDATE로 배치 전체를 반영하고, 갱신된 행 수를 반환
+-- RPC 호출 하나가 하나의 트랜잭션이므로 배치당 커밋(WAL flush)은 한 번이며, 오류 시 배치 전체가 롤백됨
+-- 실행 중인 문장의 statement_timeout은 함수 안에서 바꿀 수 없으므로(호출 역할의 설정을 따름),
+-- 앱이 잡고 있는 행 잠금 때문에 무한정 대기하지 않도록 lock_timeout으로 최악의 대기 시간을 제한
+DROP FUNCTION IF EXISTS apply_migration_batch;
+
+
+CREATE OR REPLACE FUNCTION apply_migration_batch(
+    migrated_rows JSONB,
+    target_tenant_id TEXT DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET lock_timeout = '10s'
+AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE proc_def pd
+    SET
+        bpmn = v.bpmn,
+        definition = v.definition
+    FROM jsonb_to_recordset(migrated_rows) AS v(id TEXT, tenant_id TEXT, bpmn TEXT, definition JSONB)
+    WHERE
+        pd.id = v.id
+        AND pd.tenant_id IS NOT DISTINCT FROM v.tenant_id
+        AND (
+            target_tenant_id IS NULL
+            OR pd.tenant_id = target_tenant_id
+        );
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$;
+
 -- 함수 실행 권한 부여 (필요한 경우)
 -- GRANT EXECUTE ON FUNCTION get_migration_target_processes TO your_role_name;
+-- GRANT EXECUTE ON FUNCTION apply_migration_batch TO your_role_name;
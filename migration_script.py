@@ -24,6 +24,7 @@
 주의사항:
 - 실행 전 반드시 --dry-run으로 테스트해보세요
 - 백업 테이블(proc_def_backup)이 미리 생성되어 있어야 합니다
+- 배치 조회는 id 커서(id > 마지막 id ORDER BY id) 방식이므로 migration_rpc_function.sql의 커서 인덱스가 있어야 배치마다 전체 스캔하지 않습니다
 - 마이그레이션 전에 대상 프로세스들이 자동으로 백업됩니다
 - 특정 테넌트만 처리하려면 --tenant-id 옵션을 사용하세요
 - Lock 조건을 적용하려면 --lock-user-id 옵션을 사용하세요 (lock이 없거나 해당 user_id인 경우만 마이그레이션)
@@ -32,11 +33,16 @@
 import os
 import argparse
 from supabase import create_client, Client
-import json
-import xml.etree.ElementTree as ET
+from postgrest.utils import SyncClient
+from httpx import Limits
+import orjson
+from lxml import etree as ET
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import logging
+import threading
 from dotenv import load_dotenv
 from contextvars import ContextVar
 
@@ -50,16 +56,62 @@ logger = logging.getLogger(__name__)
 # Supabase 클라이언트 전역 변수
 supabase_client_var = ContextVar('supabase', default=None)
 
+# XML 네임스페이스 URI
+BPMN_NS = 'http://www.omg.org/spec/BPMN/20100524/MODEL'
+UENGINE_NS = 'http://uengine'
+
+# 스레드별 XML 파서 (lxml 파서 인스턴스는 스레드 간에 동시에 사용할 수 없음)
+_xml_parser_local = threading.local()
+
+def get_xml_parser():
+    """대용량 BPMN용 XML 파서 반환
+    - huge_tree: 수 MB 단위 문서나 큰 텍스트 노드(uengine:json 등)도 libxml2 기본 제한에 걸리지 않도록 허용
+    - collect_ids: xml:id 색인은 사용하지 않으므로 만들지 않음 (액티비티는 index_activity_elements로 색인)
+    - resolve_entities/no_network: huge_tree로 크기 제한을 풀었으므로 테넌트가 작성한 BPMN의 엔티티 확장
+      (billion laughs 등)과 외부 리소스 로드는 막음
+    """
+    parser = getattr(_xml_parser_local, 'parser', None)
+    if parser is None:
+        parser = ET.XMLParser(huge_tree=True, collect_ids=False, resolve_entities=False, no_network=True)
+        _xml_parser_local.parser = parser
+    return parser
+
+# 새로 만드는 요소가 bpmn:/uengine: 접두사를 쓰도록 네임스페이스를 한 번만 등록 (문서에 선언된 접두사는 그대로 유지됨)
+ET.register_namespace('bpmn', BPMN_NS)
+ET.register_namespace('uengine', UENGINE_NS)
+
 
 class ActivityMetadataMigrator:
     """액티비티 메타데이터 마이그레이션 클래스"""
     
     # XML 네임스페이스
     NAMESPACES = {
-        'bpmn': 'http://www.omg.org/spec/BPMN/20100524/MODEL',
-        'uengine': 'http://uengine'
+        'bpmn': BPMN_NS,
+        'uengine': UENGINE_NS
     }
     
+    # 마이그레이션 대상 액티비티 타입
+    _TASK_TYPES = frozenset({'userTask', 'serviceTask', 'sendTask', 'receiveTask', 'scriptTask', 'manualTask'})
+    
+    # 네임스페이스가 붙은 태그 이름 (호출마다 문자열을 만들지 않도록 미리 계산)
+    _BPMN_TASK_TAGS = frozenset(f"{{{BPMN_NS}}}{activity_type}" for activity_type in _TASK_TYPES)
+    _EXT_TAG = f"{{{BPMN_NS}}}extensionElements"
+    _PROPS_TAG = f"{{{UENGINE_NS}}}properties"
+    _JSON_TAG = f"{{{UENGINE_NS}}}json"
+    
+    # 마이그레이션 대상 BPMN에 포함된 문자열 (get_target_processes의 조회 조건과 동일)
+    _MARKERS = ('variableForHtmlFormContext', 'inputMapping', 'outputMapping')
+    
+    # 백업 UPSERT 한 번에 보낼 최대 행 수
+    BACKUP_CHUNK_SIZE = 500
+    
+    # PostgREST HTTP 커넥션 풀 설정
+    # 배치 사이의 XML 처리가 httpx 기본 keep-alive 만료(5초)보다 길어지면 매 배치마다 TCP/TLS 연결을 새로 맺게 되므로 유지 시간을 늘림
+    POSTGREST_LIMITS = Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120)
+    
+    # 배치 내 프로세스 변환(XML/JSON 처리)을 병렬로 수행할 최대 스레드 수
+    MIGRATE_MAX_WORKERS = 8
+    
     def __init__(self):
         """Supabase 클라이언트를 사용한 마이그레이션 클래스 초기화"""
         self.supabase = None
@@ -76,43 +128,63 @@ class ActivityMetadataMigrator:
                 raise Exception("SUPABASE_URL과 SUPABASE_KEY 환경변수가 설정되지 않았습니다.")
             
             self.supabase = create_client(supabase_url, supabase_key)
+            self.setup_postgrest_session()
             supabase_client_var.set(self.supabase)
             logger.info("Supabase 클라이언트 연결 성공")
         except Exception as e:
             logger.error(f"Supabase 클라이언트 연결 실패: {e}")
             raise
     
-    def backup_target_processes(self, processes, tenant_id: str | None = None):
-        """마이그레이션 대상 프로세스들을 백업 테이블에 저장"""
+    def setup_postgrest_session(self):
+        """PostgREST 세션을 커넥션 풀 설정(POSTGREST_LIMITS)을 적용한 HTTP/2 클라이언트로 교체"""
+        postgrest = self.supabase.postgrest
+        default_session = postgrest.session
+        postgrest.session = SyncClient(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=default_session.timeout,
+            limits=self.POSTGREST_LIMITS,
+            follow_redirects=True,
+            http2=True,
+        )
+        default_session.close()
+    
+    def backup_target_processes(self, processes):
+        """마이그레이션 대상 프로세스들을 백업 테이블에 저장
+        전체 테넌트 실행에서는 같은 id가 여러 테넌트에 있을 수 있으므로 각 행의 실제 tenant_id로 백업
+        """
         try:
             if not processes:
                 logger.info("백업할 프로세스가 없습니다.")
                 return
             
-            # 백업 테이블에 대상 프로세스들 삽입
-            for proc_id, proc_name, definition, bpmn in processes:
-                backup_data = {
+            # 백업 테이블에 대상 프로세스들을 한 번에 UPSERT (id, tenant_id 유니크 제약 기준)
+            backup_rows = [
+                {
                     'id': proc_id,
                     'name': proc_name,
                     'definition': definition,
-                    'bpmn': bpmn
+                    'bpmn': bpmn,
+                    'tenant_id': proc_tenant_id
                 }
-                if tenant_id:
-                    backup_data['tenant_id'] = tenant_id
-                
-                # 기존 데이터가 있으면 삭제 후 삽입 (UPSERT 방식)
-                delete_query = self.supabase.table('proc_def_backup').delete().eq('id', proc_id)
-                if tenant_id:
-                    delete_query = delete_query.eq('tenant_id', tenant_id)
-                delete_query.execute()
-                response = self.supabase.table('proc_def_backup').insert(backup_data).execute()
+                for proc_id, proc_name, definition, bpmn, proc_tenant_id in processes
+            ]
+            
+            # PostgREST 요청 크기 제한을 넘지 않도록 나누어 전송
+            rows_iter = iter(backup_rows)
+            while chunk := list(islice(rows_iter, self.BACKUP_CHUNK_SIZE)):
+                response = self.supabase.table('proc_def_backup').upsert(chunk, on_conflict='id,tenant_id').execute()
                 
-                if not response.data:
-                    logger.warning(f"백업 실패: {proc_id} ({proc_name})")
-                else:
-                    logger.info(f"백업 완료: {proc_id} ({proc_name})")
+                if not response.data or len(response.data) != len(chunk):
+                    backed_up_ids = {row.get('id') for row in (response.data or [])}
+                    for row in chunk:
+                        if row['id'] not in backed_up_ids:
+                            logger.warning("백업 실패: %s (%s)", row['id'], row['name'])
             
-            logger.info(f"총 {len(processes)}개 프로세스 백업 완료")
+            # 행마다 로그를 남기지 않고 배치당 한 줄로 요약
+            logger.info("총 %d개 프로세스 백업 완료", len(processes))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("백업된 프로세스: %s", ', '.join(row['id'] for row in backup_rows))
             
         except Exception as e:
             logger.error(f"백업 과정에서 오류 발생: {e}")
@@ -145,36 +217,19 @@ class ActivityMetadataMigrator:
                     return []
                 
                 # RPC 응답에서 필요한 필드 추출
-                results = []
-                for row in response.data:
-                    try:
-                        # definition이 문자열이면 JSON 파싱, 이미 딕셔너리면 그대로 사용
-                        if isinstance(row['definition'], str):
-                            try:
-                                definition = json.loads(row['definition'])
-                            except json.JSONDecodeError:
-                                logger.warning(f"definition JSON 파싱 실패: {row['id']}")
-                                continue
-                        elif isinstance(row['definition'], dict):
-                            definition = row['definition']
-                        else:
-                            continue
-                        
-                        if 'activities' in definition:
-                            results.append((row['id'], row['name'], row['definition'], row['bpmn']))
-                    except (TypeError, AttributeError) as e:
-                        logger.warning(f"definition 처리 오류 {row['id']}: {e}")
-                        continue
+                results = self.to_target_processes(response.data)
                 
                 logger.info(f"조회된 배치 대상 (lock 조건 적용): {len(results)}개 프로세스")
                 return results
             
             else:
                 # 기존 로직 (lock 조건 없음)
-                query = self.supabase.table('proc_def').select('id, name, definition, bpmn').filter(
+                query = self.supabase.table('proc_def').select('id, name, definition, bpmn, tenant_id').filter(
                     'isdeleted', 'eq', False
                 ).filter(
                     'definition', 'not.is', 'null'
+                ).filter(
+                    'definition->activities', 'not.is', 'null'
                 ).filter(
                     'bpmn', 'not.is', 'null'
                 ).or_(
@@ -189,27 +244,7 @@ class ActivityMetadataMigrator:
 
                 response = query.limit(batch_size).execute()
                 
-                # JSON 필터링은 클라이언트 사이드에서 처리
-                results = []
-                for row in response.data:
-                    try:
-                        # definition이 문자열이면 JSON 파싱, 이미 딕셔너리면 그대로 사용
-                        if isinstance(row['definition'], str):
-                            try:
-                                definition = json.loads(row['definition'])
-                            except json.JSONDecodeError:
-                                logger.warning(f"definition JSON 파싱 실패: {row['id']}")
-                                continue
-                        elif isinstance(row['definition'], dict):
-                            definition = row['definition']
-                        else:
-                            continue
-                        
-                        if 'activities' in definition:
-                            results.append((row['id'], row['name'], row['definition'], row['bpmn']))
-                    except (TypeError, AttributeError) as e:
-                        logger.warning(f"definition 처리 오류 {row['id']}: {e}")
-                        continue
+                results = self.to_target_processes(response.data)
                 
                 logger.info(f"조회된 배치 대상: {len(results)}개 프로세스")
                 return results
@@ -217,31 +252,64 @@ class ActivityMetadataMigrator:
             logger.error(f"프로세스 조회 실패: {e}")
             raise
     
+    def to_target_processes(self, rows):
+        """조회 결과를 (id, name, definition, bpmn, tenant_id) 튜플 목록으로 변환
+        조회 조건(definition에 activities 키 존재)상 definition은 항상 JSON 객체(딕셔너리)로 전달됨
+        """
+        return [
+            (row['id'], row['name'], row['definition'], row['bpmn'], row.get('tenant_id'))
+            for row in rows
+        ]
+    
+    def count_definitions_without_activities(self, tenant_id: str | None = None) -> int:
+        """activities 키가 없어 조회 조건에서 제외되는 프로세스 수
+        JSON 문자열로 저장된 예전 definition도 여기에 포함되며, 이 스크립트로는 마이그레이션되지 않음
+        """
+        query = self.supabase.table('proc_def').select('id', count='exact', head=True).filter(
+            'isdeleted', 'eq', False
+        ).filter(
+            'definition', 'not.is', 'null'
+        ).filter(
+            'definition->activities', 'is', 'null'
+        ).filter(
+            'bpmn', 'not.is', 'null'
+        )
+        if tenant_id:
+            query = query.eq('tenant_id', tenant_id)
+        return query.execute().count or 0
+    
     def build_activity_properties(self, activity_json):
-        """액티비티 JSON에서 새로운 properties 구성"""
-        # 기본 properties 구성
+        """액티비티 JSON에서 새로운 properties 구성
+        
+        Returns:
+            tuple: (새 properties, 기존 properties에서 병합된 키 목록)
+        """
+        # 기본 properties 구성 (리스트 필드는 값이 없을 때만 새 리스트 생성)
+        get = activity_json.get
         new_properties = {
-            'role': activity_json.get('role', ''),
-            'duration': activity_json.get('duration', 5),
-            'instruction': activity_json.get('instruction', ''),
-            'description': activity_json.get('description', ''),
-            'checkpoints': activity_json.get('checkpoints', []),
-            'agentMode': activity_json.get('agentMode', 'none'),
-            'orchestration': activity_json.get('orchestration', 'none'),
-            'attachments': activity_json.get('attachments', []),
-            'inputData': activity_json.get('inputData', []),
-            'tool': activity_json.get('tool', '')
+            'role': get('role', ''),
+            'duration': get('duration', 5),
+            'instruction': get('instruction', ''),
+            'description': get('description', ''),
+            'checkpoints': get('checkpoints') or [],
+            'agentMode': get('agentMode', 'none'),
+            'orchestration': get('orchestration', 'none'),
+            'attachments': get('attachments') or [],
+            'inputData': get('inputData') or [],
+            'tool': get('tool', '')
         }
         
         # 기존 properties에서 값 추출하여 병합
-        existing_properties = self.parse_existing_properties(activity_json.get('properties'))
+        merged_keys = []
+        existing_properties = self.parse_existing_properties(get('properties'))
         if existing_properties:
             # 기존 properties의 값이 있으면 우선 적용
             for key in ['checkpoints', 'description', 'instruction']:
                 if key in existing_properties and existing_properties[key]:
                     new_properties[key] = existing_properties[key]
+                    merged_keys.append(key)
         
-        return new_properties
+        return new_properties, merged_keys
     
     def parse_existing_properties(self, properties_str):
         """기존 properties 문자열에서 JSON 파싱하여 필요한 값들 추출"""
@@ -251,7 +319,7 @@ class ActivityMetadataMigrator:
         try:
             # properties가 문자열인 경우 JSON 파싱
             if isinstance(properties_str, str):
-                existing_props = json.loads(properties_str)
+                existing_props = orjson.loads(properties_str)
             elif isinstance(properties_str, dict):
                 existing_props = properties_str
             else:
@@ -268,128 +336,122 @@ class ActivityMetadataMigrator:
             
             return result if result else None
             
-        except (json.JSONDecodeError, TypeError, AttributeError) as e:
+        except (orjson.JSONDecodeError, TypeError, AttributeError) as e:
             logger.warning(f"기존 properties 파싱 실패: {e}")
             return None
     
-    def update_xml_activity(self, xml_string, activity_id, new_properties):
-        """XML에서 특정 액티비티의 uengine:json 업데이트"""
+    def index_activity_elements(self, root):
+        """XML 트리를 한 번 순회하여 태스크 요소를 id로 색인"""
+        activity_index = {}
+        for element in root.iter(*self._BPMN_TASK_TAGS):
+            activity_index.setdefault(element.get('id'), element)
+        return activity_index
+    
+    def update_xml_activity(self, activity_index, activity_id, new_properties):
+        """색인된 XML 트리에서 특정 액티비티의 uengine:json 업데이트 (트리를 직접 수정)
+        
+        Returns:
+            bool: 액티비티를 찾아 업데이트했으면 True
+        """
         try:
-            # XML 네임스페이스 등록
-            for prefix, uri in self.NAMESPACES.items():
-                ET.register_namespace(prefix, uri)
-            
-            # XML 파싱
-            root = ET.fromstring(xml_string)
-            
-            activity_types = ['userTask', 'serviceTask', 'sendTask', 'receiveTask', 'scriptTask', 'manualTask']
-            activity_element = None
-            
-            for activity_type in activity_types:
-                xpath = f".//{{{self.NAMESPACES['bpmn']}}}{activity_type}[@id='{activity_id}']"
-                activity_element = root.find(xpath)
-                if activity_element is not None:
-                    break
+            activity_element = activity_index.get(activity_id)
             
             if activity_element is None:
                 logger.warning(f"액티비티를 찾을 수 없음: {activity_id}")
-                return xml_string
+                return False
             
             # extensionElements 찾기 또는 생성
-            ext_elem = activity_element.find(f"{{{self.NAMESPACES['bpmn']}}}extensionElements")
+            ext_elem = activity_element.find(self._EXT_TAG)
             if ext_elem is None:
-                ext_elem = ET.SubElement(activity_element, f"{{{self.NAMESPACES['bpmn']}}}extensionElements")
+                ext_elem = ET.SubElement(activity_element, self._EXT_TAG)
             
             # uengine:properties 찾기 또는 생성
-            props_elem = ext_elem.find(f"{{{self.NAMESPACES['uengine']}}}properties")
+            props_elem = ext_elem.find(self._PROPS_TAG)
             if props_elem is None:
-                props_elem = ET.SubElement(ext_elem, f"{{{self.NAMESPACES['uengine']}}}properties")
+                props_elem = ET.SubElement(ext_elem, self._PROPS_TAG)
             
             # uengine:json 찾기 또는 생성
-            json_elem = props_elem.find(f"{{{self.NAMESPACES['uengine']}}}json")
+            json_elem = props_elem.find(self._JSON_TAG)
             if json_elem is None:
-                json_elem = ET.SubElement(props_elem, f"{{{self.NAMESPACES['uengine']}}}json")
+                json_elem = ET.SubElement(props_elem, self._JSON_TAG)
             
             # JSON 데이터 업데이트
-            json_elem.text = json.dumps(new_properties, ensure_ascii=False, separators=(',', ':'))
-            
-            # XML을 문자열로 변환 (XML 선언 포함)
-            xml_string = ET.tostring(root, encoding='unicode', method='xml', xml_declaration=True)
+            json_elem.text = orjson.dumps(new_properties).decode()
             
-            return xml_string
+            return True
             
         except Exception as e:
             logger.error(f"XML 업데이트 실패 (activity: {activity_id}): {e}")
             raise
     
-    def migrate_process(self, proc_id, proc_name, definition_json, bpmn_xml):
-        """단일 프로세스 마이그레이션"""
+    def migrate_process(self, proc_id, proc_name, definition, bpmn_xml):
+        """단일 프로세스 마이그레이션
+        definition은 get_target_processes에서 딕셔너리로 정규화된 값이어야 함
+        """
         try:
-            # definition이 문자열이면 JSON 파싱, 이미 딕셔너리면 그대로 사용
-            if isinstance(definition_json, str):
-                try:
-                    definition = json.loads(definition_json)
-                except json.JSONDecodeError as e:
-                    logger.error(f"  {proc_id}: definition JSON 파싱 실패 - {e}")
-                    return -1, None, None
-            elif isinstance(definition_json, dict):
-                definition = definition_json
-            else:
-                logger.error(f"  {proc_id}: definition 데이터 타입 오류 - {type(definition_json)}")
-                return -1, None, None
-            
             activities = definition.get('activities', [])
             
             if not activities:
                 logger.info(f"  {proc_id}: 액티비티 없음, 건너뜀")
                 return 0, None, None
             
-            updated_xml = bpmn_xml
-            updated_definition = definition.copy()
+            # XML 파싱 전에 문자열 검색으로 대상이 아닌 프로세스를 걸러냄
+            if not any(marker in bpmn_xml for marker in self._MARKERS):
+                logger.info(f"  {proc_id}: 마이그레이션 대상 속성 없음, 건너뜀")
+                return 0, None, None
+            
+            # XML은 프로세스당 한 번만 파싱하고, 모든 액티비티를 반영한 뒤 한 번만 직렬화
+            root = None
+            activity_index = None
+            xml_modified = False
             updated_count = 0
+            # 액티비티별로 로그를 남기지 않고 프로세스당 한 번 요약 출력
+            merged_report = []
             
             # 각 액티비티 처리
-            for i, activity in enumerate(activities):
+            for activity in activities:
                 activity_id = activity.get('id')
                 activity_type = activity.get('type')
                 
-                if activity_type not in ['userTask', 'serviceTask', 'sendTask', 'receiveTask', 'scriptTask', 'manualTask']:
+                if activity_type not in self._TASK_TYPES:
                     continue
                 
                 # 새로운 properties 구성 (기존 properties에서 값 병합)
-                new_properties = self.build_activity_properties(activity)
+                new_properties, merged_keys = self.build_activity_properties(activity)
                 
-                # 기존 properties에서 병합된 값이 있는지 로그 출력
-                existing_properties = self.parse_existing_properties(activity.get('properties'))
-                if existing_properties:
-                    merged_keys = []
-                    for key in ['checkpoints', 'description', 'instruction']:
-                        if key in existing_properties and existing_properties[key]:
-                            merged_keys.append(key)
-                    if merged_keys:
-                        logger.info(f"  {proc_id} - {activity_id}: 기존 properties에서 병합된 키: {', '.join(merged_keys)}")
+                # 기존 properties에서 병합된 키 기록
+                if merged_keys:
+                    merged_report.append((activity_id, merged_keys))
                 
                 # XML 업데이트
-                updated_xml = self.update_xml_activity(updated_xml, activity_id, new_properties)
-                
-                # Definition JSON의 액티비티 업데이트
-                updated_activity = activity.copy()
+                if root is None:
+                    # lxml은 인코딩 선언이 있는 str을 받지 않으므로 bytes로 파싱
+                    root = ET.fromstring(bpmn_xml.encode('utf-8'), get_xml_parser())
+                    activity_index = self.index_activity_elements(root)
+                if self.update_xml_activity(activity_index, activity_id, new_properties):
+                    xml_modified = True
                 
+                # Definition JSON의 액티비티 업데이트 (복사 없이 직접 수정)
                 # 기존 properties와 outputData 키 제거 (중요!)
-                if 'properties' in updated_activity:
-                    del updated_activity['properties']
-                if 'outputData' in updated_activity:
-                    del updated_activity['outputData']
+                activity.pop('properties', None)
+                activity.pop('outputData', None)
                 
                 # 새로운 properties 추가
-                updated_activity.update(new_properties)
-                updated_definition['activities'][i] = updated_activity
+                activity.update(new_properties)
                 
                 updated_count += 1
             
             if updated_count > 0:
-                logger.info(f"  {proc_id} ({proc_name}): {updated_count}개 액티비티 업데이트")
-                return updated_count, updated_xml, updated_definition
+                # XML을 문자열로 변환 (XML 선언 포함)
+                if xml_modified:
+                    updated_xml = ET.tostring(root, encoding='utf-8', method='xml', xml_declaration=True).decode('utf-8')
+                else:
+                    updated_xml = bpmn_xml
+                logger.info("  %s (%s): %d개 액티비티 업데이트", proc_id, proc_name, updated_count)
+                if merged_report:
+                    logger.info("  %s: 기존 properties에서 병합된 키: %s", proc_id, merged_report)
+                # definition은 복사하지 않고 직접 수정함 (원본은 마이그레이션 전에 백업 테이블에 저장됨)
+                return updated_count, updated_xml, definition
             else:
                 return 0, None, None
                 
@@ -397,25 +459,26 @@ class ActivityMetadataMigrator:
             logger.error(f"  {proc_id}: 마이그레이션 실패 - {e}")
             return -1, None, None
     
-    def save_migrated_process(self, proc_id, updated_xml, updated_definition, tenant_id: str | None = None):
-        """마이그레이션된 프로세스 저장"""
+    def save_migrated_batch(self, migrated_rows, tenant_id: str | None = None):
+        """배치 단위로 마이그레이션된 프로세스 저장 (apply_migration_batch RPC로 한 번에 UPDATE)
+        배치 전체가 하나의 트랜잭션으로 커밋되므로, 실패하면 해당 배치의 어떤 프로세스도 변경되지 않습니다.
+        """
+        if not migrated_rows:
+            return
+        
         try:
-            # JSONB 타입에 맞게 딕셔너리를 그대로 저장
-            update_data = {
-                'bpmn': updated_xml,
-                'definition': updated_definition  # 딕셔너리 그대로 저장 (Supabase가 JSONB로 자동 변환)
-            }
-            
-            update_query = self.supabase.table('proc_def').update(update_data).eq('id', proc_id)
-            if tenant_id:
-                update_query = update_query.eq('tenant_id', tenant_id)
-            response = update_query.execute()
-            
-            if not response.data:
-                raise Exception(f"프로세스 {proc_id}를 찾을 수 없습니다.")
+            # definition은 딕셔너리 그대로 전달 (RPC에서 JSONB로 변환)
+            response = self.supabase.rpc('apply_migration_batch', {
+                'migrated_rows': migrated_rows,
+                'target_tenant_id': tenant_id
+            }).execute()
+            
+            updated_count = response.data or 0
+            if updated_count < len(migrated_rows):
+                raise Exception(f"{len(migrated_rows)}개 중 {updated_count}개 프로세스만 저장되었습니다.")
                 
         except Exception as e:
-            logger.error(f"  {proc_id}: 저장 실패 - {e}")
+            logger.error(f"  배치 저장 실패 ({', '.join(row['id'] for row in migrated_rows)}) - {e}")
             raise
     
     def run_migration(self, dry_run=False, batch_size: int = 5, max_batches: int = None, tenant_id: str | None = None, lock_user_id: str | None = None):
@@ -443,57 +506,78 @@ class ActivityMetadataMigrator:
         try:
             self.setup_supabase()
             
+            excluded_count = self.count_definitions_without_activities(tenant_id)
+            if excluded_count:
+                logger.warning("definition에 activities가 없어 제외된 프로세스: %d개 (JSON 문자열로 저장된 definition 포함)", excluded_count)
+            
             success_count = 0
             fail_count = 0
             total_activities = 0
             total_processes = 0
+            # 성공한 프로세스 이름 (결과 요약용)
+            completed_names = []
 
             batch_index = 0
             cursor_id = None
 
-            while True:
-                if max_batches is not None and batch_index >= max_batches:
-                    logger.info(f"최대 배치 수({max_batches})에 도달하여 중단합니다.")
-                    break
+            def fetch_batch(after_id):
+                return self.get_target_processes(batch_size=batch_size, cursor_after_id=after_id, tenant_id=tenant_id, lock_user_id=lock_user_id)
 
-                processes = self.get_target_processes(batch_size=batch_size, cursor_after_id=cursor_id, tenant_id=tenant_id, lock_user_id=lock_user_id)
+            # 현재 배치를 처리하는 동안 다음 배치를 백그라운드 스레드에서 미리 조회
+            with ThreadPoolExecutor(max_workers=1) as fetch_executor:
+                next_batch = fetch_executor.submit(fetch_batch, cursor_id)
 
-                if not processes:
-                    if batch_index == 0:
-                        logger.info("마이그레이션 대상이 없습니다.")
-                    break
+                while True:
+                    if max_batches is not None and batch_index >= max_batches:
+                        logger.info(f"최대 배치 수({max_batches})에 도달하여 중단합니다.")
+                        break
 
-                # 마이그레이션 전 백업(현재 배치만)
-                if not dry_run:
-                    logger.info("\n현재 배치 백업 중...")
-                    self.backup_target_processes(processes, tenant_id=tenant_id)
-                    logger.info("백업 완료\n")
+                    processes = next_batch.result()
 
-                logger.info(f"배치 {batch_index + 1} 처리 시작 (건수: {len(processes)})")
-                
-                for proc_id, proc_name, definition, bpmn in processes:
-                    updated_count, updated_xml, updated_definition = self.migrate_process(
-                        proc_id, proc_name, definition, bpmn
-                    )
+                    if not processes:
+                        if batch_index == 0:
+                            logger.info("마이그레이션 대상이 없습니다.")
+                        break
+
+                    # 다음 배치를 위한 커서 갱신(마지막 id) 후 바로 다음 배치 조회 시작
+                    # (다음 배치는 id가 커서보다 큰 행만 읽으므로 현재 배치의 저장과 겹치지 않음)
+                    cursor_id = processes[-1][0]
+                    if max_batches is None or batch_index + 1 < max_batches:
+                        next_batch = fetch_executor.submit(fetch_batch, cursor_id)
+
+                    # 마이그레이션 전 백업(현재 배치만)
+                    if not dry_run:
+                        logger.info("\n현재 배치 백업 중...")
+                        self.backup_target_processes(processes)
+                        logger.info("백업 완료\n")
+
+                    logger.info(f"배치 {batch_index + 1} 처리 시작 (건수: {len(processes)})")
                     
-                    if updated_count > 0:
-                        if not dry_run:
-                            self.save_migrated_process(proc_id, updated_xml, updated_definition, tenant_id=tenant_id)
-                        success_count += 1
-                        total_activities += updated_count
-                    elif updated_count < 0:
-                        fail_count += 1
-                
-                total_processes += len(processes)
-                batch_index += 1
+                    # 배치 내 프로세스들을 병렬로 변환 (결과 순서는 processes 순서와 같음)
+                    with ThreadPoolExecutor(max_workers=min(self.MIGRATE_MAX_WORKERS, len(processes))) as executor:
+                        migrate_results = list(executor.map(lambda process: self.migrate_process(*process[:4]), processes))
+                    
+                    migrated_rows = []
+                    for (proc_id, proc_name, _, _, proc_tenant_id), (updated_count, updated_xml, updated_definition) in zip(processes, migrate_results):
+                        if updated_count > 0:
+                            migrated_rows.append({'id': proc_id, 'tenant_id': proc_tenant_id, 'bpmn': updated_xml, 'definition': updated_definition})
+                            completed_names.append(proc_name)
+                            success_count += 1
+                            total_activities += updated_count
+                        elif updated_count < 0:
+                            fail_count += 1
+                    
+                    # 배치의 변경 사항을 RPC 한 번으로 저장
+                    if not dry_run:
+                        self.save_migrated_batch(migrated_rows, tenant_id=tenant_id)
+                    
+                    total_processes += len(processes)
+                    batch_index += 1
 
-                # 다음 배치를 위한 커서 갱신(마지막 id)
-                cursor_id = processes[-1][0]
-            
             # 결과 요약
             logger.info("\n" + "=" * 70)
             logger.info("마이그레이션 완료")
-            logger.info(f"완료된 프로세스: {', '.join([proc_name for _, proc_name, _, _ in processes])}")
+            logger.info("완료된 프로세스 수: %d (마지막 10개: %s)", len(completed_names), ', '.join(completed_names[-10:]))
             logger.info(f"총 프로세스: {total_processes}")
             logger.info(f"성공: {success_count}")
             logger.info(f"실패: {fail_count}")
@@ -505,7 +589,7 @@ class ActivityMetadataMigrator:
                 logger.info("=" * 50)
                 logger.info("백업 테이블: proc_def_backup")
                 logger.info("문제 발생 시 다음 쿼리로 롤백 가능:")
-                logger.info("UPDATE proc_def p SET bpmn = b.bpmn, definition = b.definition FROM proc_def_backup b WHERE p.id = b.id;")
+                logger.info("UPDATE proc_def p SET bpmn = b.bpmn, definition = b.definition FROM proc_def_backup b WHERE p.id = b.id AND p.tenant_id IS NOT DISTINCT FROM b.tenant_id;")
                 logger.info("=" * 50)
             
         except Exception as e:
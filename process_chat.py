@@ -3,18 +3,40 @@ from features.process_chat import (
     ChatRequest, TokenCountRequest, EmbeddingRequest, 
     ChatInterface
 )
-from fastapi import HTTPException
+from fastapi import Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from typing import Type
+import asyncio
+
+def json_body(model: Type[BaseModel]):
+    """
+    요청 본문을 pydantic-core의 JSON 파서로 바로 검증하는 의존성.
+    FastAPI 기본 경로(json.loads로 dict 생성 후 다시 검증)를 거치지 않습니다.
+    """
+    async def parse(request: Request) -> BaseModel:
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)
+            ])
+    return parse
+
+def json_body_openapi(model: Type[BaseModel]) -> dict:
+    # Depends로 받는 본문은 OpenAPI 문서에 자동으로 나타나지 않으므로 스키마를 직접 지정
+    return {"requestBody": {"content": {"application/json": {"schema": model.model_json_schema()}}, "required": True}}
 
 def add_routes_to_app(app):
     app.add_api_route(f"{BASE_URL}/sanity-check", sanity_check, methods=["GET"])
-    app.add_api_route(f"{BASE_URL}/messages", process_chat_messages, methods=["POST"])
-    app.add_api_route(f"{BASE_URL}/count-tokens", count_tokens, methods=["POST"])
-    app.add_api_route(f"{BASE_URL}/embeddings", get_embedding_vector, methods=["POST"])
+    app.add_api_route(f"{BASE_URL}/messages", process_chat_messages, methods=["POST"], openapi_extra=json_body_openapi(ChatRequest))
+    app.add_api_route(f"{BASE_URL}/count-tokens", count_tokens, methods=["POST"], openapi_extra=json_body_openapi(TokenCountRequest))
+    app.add_api_route(f"{BASE_URL}/embeddings", get_embedding_vector, methods=["POST"], openapi_extra=json_body_openapi(EmbeddingRequest))
 
-def sanity_check():
+async def sanity_check():
     return {"is_sanity_check": True}
 
-async def process_chat_messages(chat_request: ChatRequest):
+async def process_chat_messages(chat_request: ChatRequest = Depends(json_body(ChatRequest))):
     try:
 
         response = await ChatInterface.messages(
@@ -31,10 +53,12 @@ async def process_chat_messages(chat_request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
-async def count_tokens(count_request: TokenCountRequest):
+async def count_tokens(count_request: TokenCountRequest = Depends(json_body(TokenCountRequest))):
     try:
 
-        token_count = await ChatInterface.count_tokens(
+        # 토크나이저는 CPU 작업이므로 이벤트 루프 밖에서 실행
+        token_count = await asyncio.to_thread(
+            ChatInterface.count_tokens,
             vendor=count_request.vendor,
             model=count_request.model,
             messages=count_request.messages
@@ -46,7 +70,7 @@ async def count_tokens(count_request: TokenCountRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error counting tokens: {str(e)}")
 
-async def get_embedding_vector(embedding_request: EmbeddingRequest):
+async def get_embedding_vector(embedding_request: EmbeddingRequest = Depends(json_body(EmbeddingRequest))):
     try:
 
         embedding_vector = await ChatInterface.embeddings(
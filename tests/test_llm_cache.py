@@ -0,0 +1,26 @@
+import pytest
+from langchain_openai import ChatOpenAI
+
+from llm_cache import is_deterministic
+from features.process_chat.interfaces.chat_interface.chat_interface import build_llm_string
+
+
+@pytest.mark.parametrize("temperature, expected", [(0, True), (0.7, False)])
+def test_langchain_llm_string(temperature, expected):
+    llm = ChatOpenAI(model="gpt-4o", api_key="test", temperature=temperature)
+    assert is_deterministic(llm._get_llm_string()) is expected
+
+
+def test_langchain_llm_string_without_temperature():
+    llm = ChatOpenAI(model="gpt-4o", api_key="test")
+    assert is_deterministic(llm._get_llm_string()) is False
+
+
+@pytest.mark.parametrize("model_config, expected", [
+    ({"temperature": 0}, True),
+    ({"temperature": 0.0, "max_tokens": 100}, True),
+    ({"temperature": 1}, False),
+    ({}, False),
+])
+def test_chat_interface_llm_string(model_config, expected):
+    assert is_deterministic(build_llm_string("openai", "gpt-4o", model_config)) is expected